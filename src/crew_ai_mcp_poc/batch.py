@@ -0,0 +1,184 @@
+"""Offline batch booking pipeline for backlogs of free-text travel requests.
+
+Each line of the input JSONL is one request, ``{"id": ..., "text": ...}``,
+optionally with ``"fields"`` already known from a form (dotted path: value).
+Requests run through extraction, validation, flight selection and summary
+on a pool of workers, each in its own context server session, and one
+result line per request is appended to the output JSONL as soon as it
+finishes. The output doubles as the checkpoint: with ``--resume``, requests
+whose id is already there are skipped.
+
+    batch requests.jsonl --output results.jsonl [--workers N] [--max-in-flight N]
+          [--transport inprocess|stdio] [--flight-choice cheapest|first] [--resume]
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import time
+
+from crew_ai_mcp_poc.engine import QUESTIONS, BookingEngine, BookingSession
+from crew_ai_mcp_poc.telemetry import metrics
+
+TEXT_KEYS = ("text", "request", "input")
+
+
+def read_requests(path):
+    """Yield ``(request_id, text, fields, error)`` per non-blank line; lines without an id are numbered."""
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield f"line-{number}", None, None, f"Invalid JSON: {e}"
+                continue
+            if isinstance(record, str):
+                record = {"text": record}
+            if not isinstance(record, dict):
+                yield f"line-{number}", None, None, "Request must be a JSON object or string"
+                continue
+            text = next((record[k] for k in TEXT_KEYS if isinstance(record.get(k), str)), None)
+            fields = record.get("fields") if isinstance(record.get("fields"), dict) else None
+            error = None if text or fields else "No request text or fields"
+            yield str(record.get("id", f"line-{number}")), text, fields, error
+
+
+def completed_ids(path):
+    """Ids already in the output; a partial last line from a crash is cut off."""
+    if not os.path.exists(path):
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end != len(data):
+            f.truncate(end)
+    done = set()
+    for line in data[:end].splitlines():
+        try:
+            done.add(json.loads(line)["id"])
+        except (ValueError, KeyError, TypeError):
+            continue
+    return done
+
+
+def choose_flight(options, choice):
+    if choice == "first":
+        return options[0]
+    # Prices arrive formatted, e.g. "₹3800"
+    return min(options, key=lambda flight: float(re.sub(r"[^\d.]", "", flight.price) or "inf"))
+
+
+async def process(engine, request_id, text, fields, flight_choice):
+    """Run one request to a summary, or as far as its text and fields allow."""
+    session = BookingSession(f"batch-{request_id}")
+    result = {"id": request_id, "session_id": session.session_id, "errors": {}}
+    try:
+        # A rerun reuses the id, so drop whatever an interrupted run left behind
+        await engine.call_tool("reset_state", {"session_id": session.session_id})
+        await engine.start(session)
+        if fields:
+            turn = await engine.apply(session, fields)
+            result["errors"].update(turn.errors)
+        if text and session.stage == QUESTIONS:
+            turn = await engine.extract(session, text)
+            result["errors"].update(turn.errors)
+        if session.stage == QUESTIONS:
+            # Nobody to ask: report what the request left out
+            result.update(status="incomplete", pending=session.pending)
+        else:
+            options = await engine.suggest_flights(session)
+            if not options:
+                result["status"] = "no_flights"
+            else:
+                flight = choose_flight(options, flight_choice)
+                if await engine.select_flight(session, flight.flight_id) is None:
+                    result["status"] = "flight_rejected"
+                else:
+                    result["summary"] = await engine.summarize(session)
+                    result["status"] = "ok"
+        context = await asyncio.to_thread(engine.tools.get_context, session.session_id)
+        result["context"] = context.to_wire()
+    finally:
+        await engine.call_tool("reset_state", {"session_id": session.session_id})
+    return result
+
+
+async def run_batch(engine, args, skip):
+    queue = asyncio.Queue(maxsize=args.max_in_flight or args.workers * 2)
+    counts = {}
+    lock = asyncio.Lock()
+
+    with open(args.output, "a", encoding="utf-8") as out:
+
+        async def write(result):
+            async with lock:
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[result["status"]] = counts.get(result["status"], 0) + 1
+            metrics.incr(f"batch.{result['status']}")
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                request_id, text, fields = item
+                started = time.perf_counter()
+                try:
+                    result = await process(engine, request_id, text, fields, args.flight_choice)
+                except Exception as e:
+                    result = {"id": request_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                result["elapsed_ms"] = (time.perf_counter() - started) * 1000
+                await write(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(args.workers)]
+        # Reading blocks on the bounded queue, so only max_in_flight requests
+        # are held in memory however large the input is
+        for request_id, text, fields, error in read_requests(args.input):
+            if request_id in skip:
+                counts["skipped"] = counts.get("skipped", 0) + 1
+                continue
+            if error:
+                await write({"id": request_id, "status": "error", "error": error})
+                continue
+            skip.add(request_id)
+            await queue.put((request_id, text, fields))
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    return counts
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Process a JSONL file of free-text travel requests")
+    parser.add_argument("input")
+    parser.add_argument("--output", required=True, help="results JSONL, appended to and used as the checkpoint")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--max-in-flight", type=int, default=0, help="queued requests (default: 2 x workers)")
+    parser.add_argument("--transport", choices=["inprocess", "stdio"], default="inprocess")
+    parser.add_argument("--flight-choice", choices=["cheapest", "first"], default="cheapest")
+    parser.add_argument("--resume", action="store_true", help="skip requests already in the output")
+    args = parser.parse_args()
+
+    if not args.resume and os.path.exists(args.output) and os.path.getsize(args.output):
+        sys.exit(f"{args.output} already has results; pass --resume to continue it")
+    skip = completed_ids(args.output) if args.resume else set()
+
+    started = time.perf_counter()
+    if args.transport == "inprocess":
+        from crew_ai_mcp_poc.tools.in_process import in_process_tools
+        counts = asyncio.run(run_batch(BookingEngine(in_process_tools()), args, skip))
+    else:
+        from crew_ai_mcp_poc.tools.mcp_adapter import get_pool
+        with get_pool().lease() as connection:
+            counts = asyncio.run(run_batch(BookingEngine(connection.client()), args, skip))
+    elapsed = time.perf_counter() - started
+    sys.stderr.write(json.dumps({"counts": counts, "elapsed_seconds": elapsed}) + "\n")
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,304 @@
+"""Offline end-to-end benchmark for the booking flow.
+
+Runs scripted conversations through the booking engine (the flow shared by
+the CLI and Streamlit front ends) and through ``main.run_booking`` with a
+deterministic fake LLM, against the context server either in-process or
+over stdio. Results are printed as JSON.
+
+    bench [--transport inprocess|stdio|both] [--sessions N] [--concurrency N]
+          [--llm-latency SECONDS] [--output PATH]
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import io
+import json
+import os
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+
+from crew_ai_mcp_poc.engine import BookingEngine, BookingSession, FLIGHTS, SUMMARY, decode_result, run_tool
+from crew_ai_mcp_poc.llm_cache import MemoryBackend, ResponseCache
+from crew_ai_mcp_poc.telemetry import percentile
+from crew_ai_mcp_poc.tools.in_process import in_process_tools
+
+# One scripted booking: the first answer and every free-text answer need the
+# (fake) LLM; options and dates are fast-path answers to the question just asked.
+SCRIPT = [
+    "book a flight from Pune to Delhi on 12/06/2026 for client work",
+    "Apollo rollout",
+    "client",
+    "domestic",
+    "one way",
+    "yes",
+    "client workshop",
+    "Asha Rao",
+    "self",
+    "Ravi Menon",
+    "Delhi",
+    "14/06/2026",
+    "16/06/2026",
+    "Connaught Place office",
+]
+
+ROUTE_PATTERN = re.compile(
+    r"from\s+(?P<origin>[a-z ]+?)\s+to\s+(?P<destination>[a-z ]+?)\s+on\s+(?P<date>\d{1,2}/\d{1,2}/\d{4})",
+    re.IGNORECASE,
+)
+
+# The user input and asked field in a structured extraction prompt
+PROMPT_INPUT = re.compile(r'User input: "(.*)"')
+PROMPT_FIELD = re.compile(r"The user was asked for (\S+?|any booking field)\.\n")
+
+# Per-session call counter; worker threads inherit it from the session's task
+_session_calls = contextvars.ContextVar("session_calls", default=None)
+
+
+class CountingTool:
+    """Wraps an MCP tool and counts its calls, in total and per session."""
+
+    def __init__(self, tool, counter):
+        self._tool = tool
+        self._counter = counter
+        self.name = tool.name
+        self.args_schema = getattr(tool, "args_schema", None)
+
+    def run(self, args):
+        self._counter["tool_calls"] += 1
+        session_calls = _session_calls.get()
+        if session_calls is not None:
+            session_calls[0] += 1
+        return self._tool.run(args)
+
+
+class FakeRegistry:
+    """Deterministic stand-in for the crew registry: no network, fixed latency.
+
+    The extraction "agent" reads the pending fields and applies what it can
+    parse with the same tool calls a real agent would make.
+    """
+
+    def __init__(self, tools, latency=0.0):
+        self.tools = tools
+        self.latency = latency
+        self.calls = 0
+
+    def kickoff(self, task_key, inputs=None):
+        inputs = inputs or {}
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if task_key == "extract_fields_node":
+            return _FakeOutput(self._extract(inputs["user_input"], inputs["session_id"]))
+        return _FakeOutput(f"[fake {task_key} output]")
+
+    def call(self, agent_name, messages):
+        """Structured extraction: the same parse, returned as a JSON object."""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        prompt = messages[-1]["content"]
+        user_input, field = PROMPT_INPUT.search(prompt), PROMPT_FIELD.search(prompt)
+        if user_input is None or field is None:
+            # Not an extraction prompt, e.g. an edit the fast path did not resolve
+            return "{}"
+        field = field.group(1)
+        return json.dumps(self._parse(user_input.group(1), field if "." in field else None))
+
+    def _parse(self, user_input, field):
+        m = ROUTE_PATTERN.search(user_input)
+        if m:
+            return {
+                "travelPlan.leavingFrom": m.group("origin").strip().title(),
+                "travelPlan.goingTo": m.group("destination").strip().title(),
+                "travelPlan.departureDate": m.group("date"),
+                "travelPlan.travelMode": "air",
+            }
+        return {field: user_input.strip()} if field else {}
+
+    def _extract(self, user_input, session_id):
+        pending = decode_result(run_tool(self.tools, "get_pending_fields", {"session_id": session_id}))
+        field = pending if isinstance(pending, str) else (pending or [None])[0]
+        updates = self._parse(user_input, field)
+        if not updates:
+            return "No update."
+        result = run_tool(self.tools, "update_fields", {"session_id": session_id, "updates": updates, "atomic": False})
+        return json.dumps(decode_result(result))
+
+
+class _FakeOutput:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def __str__(self):
+        return self.raw
+
+
+async def run_scripted_session(engine, turn_latencies, turn_tool_calls, prompt_tokens):
+    calls = [0]
+    _session_calls.set(calls)
+    session = BookingSession()
+    await engine.start(session)
+    answers = iter(SCRIPT)
+    while session.stage not in (FLIGHTS, SUMMARY):
+        answer = next(answers, None)
+        if answer is None:
+            raise RuntimeError(f"Script ran out of answers; pending: {session.pending}")
+        calls_before = calls[0]
+        started = time.perf_counter()
+        turn = await engine.answer(session, answer)
+        if turn.prompt_tokens:
+            prompt_tokens.append(turn.prompt_tokens)
+        turn_latencies.append(time.perf_counter() - started)
+        turn_tool_calls.append(calls[0] - calls_before)
+
+    options = await engine.suggest_flights(session)
+    if options:
+        await engine.select_flight(session, "1")
+    await engine.summarize(session)
+    await engine.confirm(session)
+    await engine.call_tool("reset_state", {"session_id": session.session_id})
+
+
+async def bench_engine(tools, sessions, concurrency, llm_latency):
+    counter = {"tool_calls": 0}
+    counted = [CountingTool(t, counter) for t in tools]
+    registry = FakeRegistry(counted, llm_latency)
+    # A private in-memory cache, so runs start cold and leave nothing on disk
+    llm_cache = ResponseCache([MemoryBackend()])
+    engine = BookingEngine(counted, registry=registry, llm_cache=llm_cache)
+    turn_latencies, turn_tool_calls, prompt_tokens = [], [], []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await run_scripted_session(engine, turn_latencies, turn_tool_calls, prompt_tokens)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        "sessions": sessions,
+        "concurrency": concurrency,
+        "turns": len(turn_latencies),
+        "turn_latency_p50_ms": percentile(turn_latencies, 50) * 1000,
+        "turn_latency_p99_ms": percentile(turn_latencies, 99) * 1000,
+        "tool_calls_per_turn": statistics.mean(turn_tool_calls) if turn_tool_calls else 0.0,
+        "tool_calls_total": counter["tool_calls"],
+        "llm_calls": registry.calls,
+        "prompt_tokens_per_llm_call": statistics.mean(prompt_tokens) if prompt_tokens else 0.0,
+        "fast_path": engine.fast_path.stats(),
+        "llm_cache": llm_cache.stats(),
+        "sessions_per_second": sessions / elapsed if elapsed else 0.0,
+        "elapsed_seconds": elapsed,
+    }
+
+
+def bench_cli(tools, llm_latency):
+    """Drive main.run_booking with scripted input, as the CLI would run it."""
+    from crew_ai_mcp_poc import main as cli
+
+    counter = {"tool_calls": 0}
+    counted = [CountingTool(t, counter) for t in tools]
+    engine = BookingEngine(
+        counted, registry=FakeRegistry(counted, llm_latency), llm_cache=ResponseCache([MemoryBackend()])
+    )
+    answers = iter(SCRIPT + ["1", "yes"])
+    prompts = []
+
+    async def scripted_input(prompt):
+        prompts.append(time.perf_counter())
+        return next(answers, "exit")
+
+    original = cli.ainput
+    cli.ainput = scripted_input
+    try:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            asyncio.run(cli.run_booking(engine, BookingSession()))
+        elapsed = time.perf_counter() - started
+    finally:
+        cli.ainput = original
+
+    gaps = [b - a for a, b in zip(prompts, prompts[1:])]
+    return {
+        "prompts": len(prompts),
+        "prompt_gap_p50_ms": percentile(gaps, 50) * 1000,
+        "prompt_gap_p99_ms": percentile(gaps, 99) * 1000,
+        "tool_calls": counter["tool_calls"],
+        "elapsed_seconds": elapsed,
+    }
+
+
+def session_memory(count=1000):
+    """Bytes of server memory held per live session in the in-process store."""
+    from crew_ai_mcp_poc.servers import context_server
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    ids = [f"bench-mem-{i}" for i in range(count)]
+    for session_id in ids:
+        context_server.update_field(session_id, "travelPlan.travelType", "domestic")
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    for session_id in ids:
+        context_server.reset_state(session_id)
+    grown = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    return grown / count
+
+
+def run_transport(transport, args):
+    result = {"transport": transport}
+    if transport == "inprocess":
+        tools = in_process_tools()
+        result["memory_per_session_bytes"] = session_memory()
+        result["engine"] = asyncio.run(bench_engine(tools, args.sessions, args.concurrency, args.llm_latency))
+        result["cli"] = bench_cli(tools, args.llm_latency)
+        return result
+
+    from crew_ai_mcp_poc.tools.mcp_adapter import get_pool
+    pool = get_pool()
+    with pool.lease() as connection:
+        tools = list(connection.tools)
+        result["engine"] = asyncio.run(bench_engine(tools, args.sessions, args.concurrency, args.llm_latency))
+        result["cli"] = bench_cli(tools, args.llm_latency)
+    result["pool"] = pool.stats()
+    result["subprocess_spawns"] = result["pool"]["spawns"]
+    return result
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Offline booking flow benchmark")
+    parser.add_argument("--transport", choices=["inprocess", "stdio", "both"], default="inprocess")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="seconds per fake LLM call")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+    # Bench sessions stay in memory: no field log on disk to grow or replay
+    os.environ.setdefault("CONTEXT_STORE_PATH", "")
+    # Confirmed bench bookings go to an in-memory queue that drops them
+    os.environ.setdefault("APPROVAL_QUEUE_PATH", "")
+    os.environ.setdefault("APPROVAL_SINK", "null")
+
+    transports = ["inprocess", "stdio"] if args.transport == "both" else [args.transport]
+    report = {
+        "config": vars(args),
+        "results": [run_transport(t, args) for t in transports],
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    run()
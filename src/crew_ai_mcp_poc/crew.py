@@ -1,51 +1,165 @@
-from crewai import Agent, Task, Crew, Process
-from crew_ai_mcp_poc.tools.mcp_adapter import get_mcp_tools
-import yaml
+# crewai and yaml are imported where they are first needed: importing this
+# module (for load_config or model_name) must stay cheap for the CLI
+from crew_ai_mcp_poc.routing import CallPolicy, call_with_policy, resolve_model
+from crew_ai_mcp_poc.telemetry import span
+from dataclasses import replace
+from functools import lru_cache
+import threading
 import os
 
+# Stream LLM tokens through the crewAI event bus so front ends can render them live
+STREAM_LLM = os.getenv("LLM_STREAM", "false").lower() == "true"
+# Agent chatter is off by default; spans and metrics cover turn timing
+CREW_VERBOSE = os.getenv("CREW_VERBOSE", "false").lower() == "true"
+
 # Load YAMLs
 def load_yaml(file_path):
+    import yaml
     with open(file_path, "r") as f:
         return yaml.safe_load(f)
 
-def build_crew():
-    base_path = os.path.dirname(__file__)
-    agents_config = load_yaml(os.path.join(base_path, "config", "agents.yaml"))
-    tasks_config = load_yaml(os.path.join(base_path, "config", "tasks.yaml"))
-
-    tools = get_mcp_tools().tools
-    if not tools:
-        raise ValueError("No MCP tools loaded. Ensure the MCP server is running.")
-
-    # Instantiate Agents
-    agents = {}
-    for name, cfg in agents_config.items():
-        agents[name] = Agent(
-            role=cfg['role'],
-            goal=cfg['goal'],
-            backstory=cfg['backstory'],
-            tools=tools,
-            verbose=True,
-            allow_delegation=False
-        )
+@lru_cache(maxsize=1)
+def load_config():
+    with span("crew.load_config"):
+        base_path = os.path.dirname(__file__)
+        agents_config = load_yaml(os.path.join(base_path, "config", "agents.yaml"))
+        tasks_config = load_yaml(os.path.join(base_path, "config", "tasks.yaml"))
+        return agents_config, tasks_config
+
+
+def role_tools(tools, cfg):
+    """The tools an agent lists under ``tools`` in agents.yaml; every schema costs prompt tokens."""
+    wanted = set(cfg.get('tools') or [])
+    return [tool for tool in tools if tool.name in wanted]
+
+
+def model_name(agent_name):
+    """The model an agent is routed to, as configured; used to key cached responses."""
+    return resolve_model(load_config()[0].get(agent_name, {}))
+
+
+def build_llm(policy):
+    if not policy.model:
+        # crewAI's default model, with its default client settings
+        return None
+    from crewai import LLM
+    # Retries are ours (call_with_policy), so the client gives up after one try
+    return LLM(model=policy.model, stream=STREAM_LLM, timeout=policy.timeout, max_retries=0)
+
+
+class CrewRegistry:
+    """Agents, task templates and single-task crews built once per tool set.
+
+    Task descriptions in ``tasks.yaml`` are templates; per-request values are
+    supplied through ``kickoff(task_key, inputs)`` instead of rebuilding tasks.
+    """
+
+    def __init__(self, tools):
+        if not tools:
+            raise ValueError("No MCP tools loaded. Ensure the MCP server is running.")
+        from crewai import Agent, Task
+        self.tools = tools
+        agents_config, tasks_config = load_config()
+
+        # Instantiate Agents, each on its routed model and call policy
+        self.agents = {}
+        self.policies = {}
+        for name, cfg in agents_config.items():
+            policy = self.policies[name] = CallPolicy.from_config(cfg)
+            self.agents[name] = Agent(
+                role=cfg['role'],
+                goal=cfg['goal'],
+                backstory=cfg['backstory'],
+                tools=role_tools(tools, cfg),
+                llm=build_llm(policy),
+                max_iter=policy.max_iter,
+                max_execution_time=int(policy.deadline),
+                verbose=CREW_VERBOSE,
+                allow_delegation=False
+            )
 
-    # Instantiate Tasks and tag with their YAML key
-    task_map = {}
-    for key, t in tasks_config.items():
-        task = Task(
-            description=t['description'],
-            expected_output=t['expected_output'],
-            agent=agents[get_agent_by_task(key)],
-            async_execution=False
+        # Instantiate Tasks and tag with their YAML key
+        self.tasks = {}
+        for key, t in tasks_config.items():
+            self.tasks[key] = Task(
+                description=t['description'],
+                expected_output=t['expected_output'],
+                agent=self.agents[get_agent_by_task(key)],
+                async_execution=False
+            )
+
+        self._crews = {}
+        self._locks = {key: threading.Lock() for key in self.tasks}
+
+    def crew(self, task_key):
+        if task_key not in self.tasks:
+            raise ValueError(f"Task '{task_key}' not found. Check task config.")
+        crew = self._crews.get(task_key)
+        if crew is None:
+            from crewai import Crew
+            task = self.tasks[task_key]
+            crew = Crew(agents=[task.agent], tasks=[task])
+            self._crews[task_key] = crew
+        return crew
+
+    def kickoff(self, task_key, inputs=None):
+        crew = self.crew(task_key)
+        agent_name = get_agent_by_task(task_key)
+        policy = self.policies[agent_name]
+        # Hedging or retrying a crew whose agent calls tools would repeat its
+        # writes: a timed-out attempt keeps running in the background
+        side_effects = bool(self.agents[agent_name].tools)
+        if side_effects:
+            policy = replace(policy, retries=0)
+        with span("crew.kickoff", task=task_key):
+            return call_with_policy(lambda: self._run(task_key, crew, inputs), policy, hedge=not side_effects)
+
+    def _run(self, task_key, crew, inputs):
+        lock = self._locks[task_key]
+        # A crew holds per-run state, so a concurrent caller (or a hedged
+        # request) runs on a copy instead of waiting for the shared instance.
+        shared = lock.acquire(blocking=False)
+        if not shared:
+            return crew.copy().kickoff(inputs=inputs or {})
+        try:
+            return crew.kickoff(inputs=inputs or {})
+        finally:
+            lock.release()
+
+    def call(self, agent_name, messages):
+        """One tool-free completion on an agent's LLM, without a crew run."""
+        llm = self.agents[agent_name].llm
+        with span("crew.call", agent=agent_name):
+            return call_with_policy(lambda: llm.call(messages), self.policies[agent_name])
+
+    def full_crew(self):
+        from crewai import Crew, Process
+        return Crew(
+            agents=list(self.agents.values()),
+            tasks=list(self.tasks.values()),
+            process=Process.sequential
         )
-        task_map[key] = task
 
-    crew = Crew(
-        agents=list(agents.values()),
-        tasks=list(task_map.values()),
-        process=Process.sequential
-    )
-    return crew
+
+_registries = {}
+_registries_lock = threading.Lock()
+
+def get_crew_registry(tools=None):
+    if tools is None:
+        from crew_ai_mcp_poc.tools.mcp_adapter import get_mcp_tools
+        tools = get_mcp_tools().tools
+    tools = list(tools)
+    key = tuple(id(t) for t in tools)
+    with _registries_lock:
+        registry = _registries.get(key)
+        if registry is None:
+            with span("crew.build"):
+                registry = CrewRegistry(tools)
+            _registries[key] = registry
+        return registry
+
+def build_crew(tools=None):
+    return get_crew_registry(tools).full_crew()
 
 def get_agent_by_task(task_key):
     if "extract" in task_key:
@@ -56,36 +170,12 @@ def get_agent_by_task(task_key):
         return "edit_handler_agent"
     elif "summary" in task_key:
         return "summary_agent"
-    elif "booking" in task_key:
+    elif "booking" in task_key or "flight" in task_key:
         return "flight_options_agent"
     return "question_agent"
 
-def run_extraction_task(user_input, tools):
-    extractor = Agent(
-        role="Field Extraction Agent",
-        goal="Extract structured travel booking data from user input.",
-        backstory="Expert in reading user input and extracting valid values and updating MCP context accordingly.",
-        tools=tools,
-        llm = os.getenv("MODEL"),
-        verbose=True,
+def run_extraction_task(user_input, tools, session_id):
+    return get_crew_registry(tools).kickoff(
+        "extract_fields_node",
+        {"user_input": user_input, "session_id": session_id},
     )
-
-    task = Task(
-        description=(
-            f"You are given the following user input:\n\n"
-            f"\"{user_input}\"\n\n"
-            "Extract values from user input. Validate the field against which the question was asked "
-            "and use the 'update_field' tool to update it with the correct value.\n"
-            "If the input is invalid, then don't extract the value and skip updating."
-            "If user says 'book a flight from A to B on date X', then understand that flight corresponds to " \
-            "the 'travel mode' field in MCP context and its value should always be considered as 'air'. \n"
-            "Always understand the context of the response and update the relevant field in MCP context.\n"
-            "If the field is already set, then update it with the new value only if it is different from the existing one.\n"
-        ),
-        expected_output="A field updated in context via MCP, or no update if nothing relevant found.",
-        agent=extractor
-    )
-
-    crew = Crew(agents=[extractor], tasks=[task])
-    result = crew.kickoff()
-    return result
@@ -0,0 +1,578 @@
+import asyncio
+import contextvars
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from crew_ai_mcp_poc.crew import get_crew_registry, model_name
+from crew_ai_mcp_poc.extraction import EXTRACTION_MODE, parse_reply, response_schema, validate_reply
+from crew_ai_mcp_poc.fast_path import FastPathExtractor, next_pending_field
+from crew_ai_mcp_poc.llm_cache import cache_key, get_shared_cache
+from crew_ai_mcp_poc.prompts import PromptBuilder
+from crew_ai_mcp_poc.servers.schema import FIELD_ORDER
+from crew_ai_mcp_poc.summary import SUMMARY_MODE, render_summary, shared_summary_cache
+from crew_ai_mcp_poc.telemetry import metrics, new_turn_id, span
+from crew_ai_mcp_poc.tools.client import ToolClient, decode_result
+
+# Conversation stages, in the order a booking moves through them
+WELCOME = "welcome"
+QUESTIONS = "questions"
+FLIGHTS = "flights"
+SUMMARY = "summary"
+EDIT = "edit"
+DONE = "done"
+
+EXIT_COMMANDS = ("exit", "quit")
+
+# Flight options and the summary are prepared in the background as soon as
+# their inputs are known, so the stage that shows them does not wait
+SPECULATE = os.getenv("SPECULATE", "true").lower() == "true"
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", "4"))
+ROUTE_FIELDS = ("travelPlan.leavingFrom", "travelPlan.goingTo", "travelPlan.departureDate")
+
+# The fields each derived stage is computed from; None means every field
+# and the selected flight. An edit recomputes only the stages it touches.
+STAGE_INPUTS = {
+    FLIGHTS: frozenset(ROUTE_FIELDS),
+    SUMMARY: None,
+}
+
+
+def invalidated_stages(changed):
+    """The derived stages whose output depends on any of the ``changed`` fields."""
+    if not changed:
+        return []
+    return [stage for stage, inputs in STAGE_INPUTS.items() if inputs is None or inputs.intersection(changed)]
+
+# Threads rather than tasks, so results outlive the event loop that started
+# them (Streamlit runs a fresh loop per action)
+_speculation_pool = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="speculate")
+
+def get_tool(tools, name):
+    return ToolClient.wrap(tools).get(name)
+
+def run_tool(tools, tool_name, input_dict):
+    """Run a tool by name on a tool list or ToolClient; raises ValueError if it is missing."""
+    return ToolClient.wrap(tools).call(tool_name, input_dict)
+
+# Where the LLM tokens of the current kickoff should go. Worker threads
+# inherit it from the coroutine that started them.
+_token_sink = contextvars.ContextVar("token_sink", default=None)
+_stream_listener_installed = False
+_stream_listener_lock = threading.Lock()
+
+def _install_stream_listener():
+    global _stream_listener_installed
+    with _stream_listener_lock:
+        if _stream_listener_installed:
+            return
+        _stream_listener_installed = True
+        try:
+            from crewai.utilities.events import crewai_event_bus
+            from crewai.utilities.events.llm_events import LLMStreamChunkEvent
+        except ImportError:
+            return
+
+        @crewai_event_bus.on(LLMStreamChunkEvent)
+        def _forward_chunk(source, event):
+            sink = _token_sink.get()
+            if sink is not None:
+                sink(event.chunk)
+
+
+def format_flight(flight):
+    return (
+        f"{flight.airline} ({flight.flight_id}), {flight.departure_time}, "
+        f"{flight.price}, {flight.cabin}"
+    )
+
+
+def model_error(error):
+    """What the user is told when a model call fails or runs out of time."""
+    if isinstance(error, TimeoutError):
+        return "The assistant took too long to answer; please try again."
+    return f"The assistant could not answer ({type(error).__name__}); please try again."
+
+
+class BookingSession:
+    """Conversation state for one booking, independent of the front end."""
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.stage = WELCOME
+        self.last_question = ""
+        self.pending = []
+        self.flight_options = None
+        self.summary = None
+        # Route revision the flight options were searched for, and the
+        # stage an edit returns to
+        self.flights_revision = None
+        self.edit_from = None
+        # Route revision the selected flight was chosen for, if any
+        self.selected_revision = None
+        # Server context version seen by the last advance, and local counters
+        # that key speculative work: any change, and route changes
+        self.server_version = None
+        self.revision = 0
+        self.route_revision = 0
+        self.speculation = {}
+
+
+@dataclass
+class TurnResult:
+    stage: str
+    message: str = ""
+    pending: list = field(default_factory=list)
+    fast_path: bool = False
+    errors: dict = field(default_factory=dict)
+    # Fields whose stored value this turn changed
+    changed: list = field(default_factory=list)
+    # Estimated input tokens of the LLM prompt this turn needed, if any
+    prompt_tokens: int = 0
+
+
+class BookingEngine:
+    """Asyncio state machine over the welcome/questions/flights/summary stages.
+
+    Blocking tool calls and crew kickoffs run in worker threads so a single
+    event loop can drive many sessions; a turn costs one apply_and_advance
+    round-trip on top of any extraction work. Flight options are searched in
+    the background once the route is filled, and the summary once a flight
+    is selected; edits to their inputs discard that work.
+    Pass ``on_token`` to receive streamed LLM output on the event loop thread.
+    The crew registry and prompt builder are created on the first turn that
+    needs an LLM, so answering from the fast path never imports crewAI.
+    """
+
+    def __init__(self, tools, registry=None, fast_path=None, summary_cache=None, prompts=None, llm_cache=None,
+                 extraction_mode=EXTRACTION_MODE):
+        self.tools = ToolClient.wrap(tools)
+        self.extraction_mode = extraction_mode
+        self._registry = registry
+        # None for a registry passed in, which the engine does not rebuild
+        self._registry_generation = None
+        self._prompts = prompts
+        self._lazy_lock = threading.Lock()
+        self.fast_path = fast_path or FastPathExtractor.from_server(self.tools, run_tool)
+        self.summary_cache = summary_cache or shared_summary_cache
+        self.llm_cache = llm_cache or get_shared_cache()
+        self.extraction_model = model_name("extraction_agent")
+
+    @property
+    def registry(self):
+        # Built over the current tools; rebuilt if a dead connection renewed them
+        generation = self.tools.generation
+        if self._registry is None or self._registry_generation not in (None, generation):
+            with self._lazy_lock:
+                if self._registry is None or self._registry_generation not in (None, generation):
+                    self._registry = get_crew_registry(self.tools)
+                    self._registry_generation = generation
+        return self._registry
+
+    @property
+    def prompts(self):
+        if self._prompts is None:
+            with self._lazy_lock:
+                if self._prompts is None:
+                    self._prompts = PromptBuilder(self.tools)
+        return self._prompts
+
+    async def call_tool(self, name, args=None):
+        return await self.tools.acall(name, args)
+
+    @contextmanager
+    def _streaming(self, on_token):
+        if on_token is None:
+            yield
+            return
+        _install_stream_listener()
+        loop = asyncio.get_running_loop()
+        token = _token_sink.set(lambda chunk: loop.call_soon_threadsafe(on_token, chunk))
+        try:
+            yield
+        finally:
+            _token_sink.reset(token)
+
+    async def kickoff(self, task_key, inputs=None, on_token=None):
+        with self._streaming(on_token):
+            return await asyncio.to_thread(self.registry.kickoff, task_key, inputs)
+
+    def _model_failed(self, session, error, stage=QUESTIONS):
+        # The call policy has already retried; the user can simply answer again
+        metrics.incr("turns.model_errors")
+        return TurnResult(stage, session.last_question, session.pending, errors={"model": model_error(error)})
+
+    async def _cache_extraction(self, session, key, since):
+        # What the agent wrote is exactly what changed since the turn began
+        delta = await asyncio.to_thread(self.tools.get_context_delta, session.session_id, since)
+        updates = {f: v for f, v in delta.changed.items() if f != "selectedFlight"}
+        if delta.since == since and updates:
+            await asyncio.to_thread(self.llm_cache.put, key, updates)
+
+    def _record_usage(self, report, result):
+        metrics.incr(f"prompt.calls.{report.task}")
+        metrics.incr(f"prompt.tokens.{report.task}", report.tokens)
+        usage = getattr(result, "token_usage", None)
+        if usage is not None:
+            metrics.incr("llm.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+
+    def _speculate(self, session, name, key, fn, *args):
+        """Start ``fn`` in the background unless work for the same key is running."""
+        if not SPECULATE:
+            return
+        current = session.speculation.get(name)
+        if current is not None:
+            if current[0] == key:
+                return
+            current[1].cancel()
+        session.speculation[name] = (key, _speculation_pool.submit(fn, *args))
+        metrics.incr(f"speculation.{name}.started")
+
+    async def _speculated(self, session, name, key):
+        """Result of speculative work for ``key``, or None if there is none usable."""
+        entry = session.speculation.pop(name, None)
+        if entry is None:
+            return None
+        if entry[0] != key:
+            entry[1].cancel()
+            metrics.incr(f"speculation.{name}.stale")
+            return None
+        try:
+            result = await asyncio.wrap_future(entry[1])
+        except Exception:
+            metrics.incr(f"speculation.{name}.failed")
+            return None
+        metrics.incr(f"speculation.{name}.used")
+        return result
+
+    def _cancel_speculation(self, session):
+        for _, future in session.speculation.values():
+            future.cancel()
+        session.speculation.clear()
+
+    def _track_changes(self, session, advance):
+        if advance.version == session.server_version:
+            return
+        session.revision += 1
+        # Every applied update bumps the server version once; anything beyond
+        # that was written by the extraction agent, and may touch the route
+        explained = (
+            session.server_version is not None
+            and advance.version - session.server_version == len(advance.updated)
+        )
+        if not explained or any(f in advance.diff for f in ROUTE_FIELDS):
+            session.route_revision += 1
+        session.server_version = advance.version
+
+    async def _advance(self, session, updates=None):
+        # One round-trip applies the updates and returns the next question
+        advance = await asyncio.to_thread(self.tools.apply_and_advance, session.session_id, updates)
+        session.pending = advance.pending
+        self._track_changes(session, advance)
+        changed = list(advance.diff)
+        route_ready = not any(f in session.pending for f in ROUTE_FIELDS)
+        if route_ready and session.flights_revision != session.route_revision:
+            self._speculate(
+                session, "flights", session.route_revision, self.tools.search_flights, session.session_id
+            )
+        if not session.pending and self._selection_current(session):
+            # Questions an edit added are answered; the route and its flight still hold
+            session.stage = SUMMARY
+            session.summary = None
+            self._speculate_summary(session)
+            return TurnResult(
+                SUMMARY, "All fields are collected! Your flight is unchanged.",
+                errors=advance.errors, changed=changed,
+            )
+        if not session.pending:
+            session.stage = FLIGHTS
+            return TurnResult(
+                FLIGHTS, "All fields are collected! Let's move to booking options...",
+                errors=advance.errors, changed=changed,
+            )
+        session.stage = QUESTIONS
+        session.last_question = advance.next_question or ""
+        return TurnResult(QUESTIONS, session.last_question, session.pending, errors=advance.errors, changed=changed)
+
+    def _selection_current(self, session):
+        return (
+            session.edit_from is not None
+            and session.flights_revision == session.route_revision
+            and session.selected_revision == session.route_revision
+        )
+
+    async def start(self, session):
+        return await self._advance(session)
+
+    async def apply(self, session, updates):
+        """Apply field values that are already known, e.g. from a form; invalid ones come back as errors."""
+        return await self._advance(session, updates)
+
+    async def answer(self, session, user_input, on_token=None):
+        with span("turn", turn_id=new_turn_id(), session_id=session.session_id):
+            metrics.incr("turns")
+            asked_field = next_pending_field(session.pending)
+            value = self.fast_path.match(asked_field, user_input)
+            if value is not None:
+                result = await self._advance(session, {asked_field: value})
+                accepted = asked_field not in result.errors
+                self.fast_path.record(True, accepted)
+                if accepted:
+                    metrics.incr("turns.fast_path")
+                    result.fast_path = True
+                    return result
+            else:
+                self.fast_path.record(False, False)
+
+            key = None
+            if self.llm_cache is not None:
+                key = cache_key(asked_field, user_input, self.extraction_model)
+                cached = await asyncio.to_thread(self.llm_cache.get, key)
+                if cached is not None:
+                    metrics.incr("turns.llm_cache")
+                    return await self._advance(session, cached)
+
+            if self.extraction_mode == "structured":
+                return await self._extract_structured(session, user_input, asked_field, key, on_token)
+
+            try:
+                inputs, report = self.prompts.extraction(
+                    user_input, session.session_id, asked_field,
+                    self.fast_path.field_options.get(asked_field), session.pending,
+                )
+            except ValueError as e:
+                return TurnResult(QUESTIONS, session.last_question, session.pending, errors={"input": str(e)})
+            since = session.server_version
+            try:
+                result = await self.kickoff("extract_fields_node", inputs, on_token)
+            except Exception as e:
+                return self._model_failed(session, e)
+            self._record_usage(report, result)
+            turn = await self._advance(session)
+            turn.prompt_tokens = report.tokens
+            if key is not None and since is not None:
+                await self._cache_extraction(session, key, since)
+            return turn
+
+    async def extract(self, session, user_input, on_token=None):
+        """Fill whatever pending fields a free-text request gives, in one structured completion.
+
+        For input that answers no particular question, such as a batch
+        request: the fast path and the cache, both keyed to the field that
+        was asked, are skipped.
+        """
+        with span("turn", turn_id=new_turn_id(), session_id=session.session_id):
+            metrics.incr("turns")
+            return await self._extract_structured(session, user_input, None, None, on_token)
+
+    async def _extract_structured(self, session, user_input, asked_field, key, on_token=None):
+        # One completion for every pending field, validated here and applied
+        # in a single batch; rejected values are reported, not retried
+        try:
+            messages, report = self.prompts.structured_extraction(
+                user_input, asked_field, response_schema(session.pending)
+            )
+        except ValueError as e:
+            return TurnResult(QUESTIONS, session.last_question, session.pending, errors={"input": str(e)})
+        try:
+            with self._streaming(on_token):
+                reply = await asyncio.to_thread(self.registry.call, "extraction_agent", messages)
+        except Exception as e:
+            return self._model_failed(session, e)
+        metrics.incr(f"prompt.calls.{report.task}")
+        metrics.incr(f"prompt.tokens.{report.task}", report.tokens)
+        try:
+            updates, errors = validate_reply(parse_reply(reply))
+        except ValueError as e:
+            updates, errors = {}, {"input": str(e)}
+        turn = await self._advance(session, updates or None)
+        turn.errors = {**errors, **turn.errors}
+        turn.prompt_tokens = report.tokens
+        if key is not None and updates and not turn.errors:
+            await asyncio.to_thread(self.llm_cache.put, key, updates)
+        return turn
+
+    async def suggest_flights(self, session, page=1):
+        """Search the flight index for the session's route; no LLM involved."""
+        result = await self._speculated(session, "flights", session.route_revision) if page == 1 else None
+        if result is None:
+            try:
+                result = await asyncio.to_thread(self.tools.search_flights, session.session_id, page=page)
+            except ValueError:
+                # The route is incomplete or the server returned an error message
+                result = None
+        session.flight_options = result.results if result is not None else []
+        session.flights_revision = session.route_revision
+        return session.flight_options
+
+    async def select_flight(self, session, option):
+        """Select by 1-based position in the last search, or by flight id; None if it is not valid."""
+        option = option.strip()
+        options = session.flight_options or []
+        if option.isdigit():
+            if not 1 <= int(option) <= len(options):
+                return None
+            flight_id = options[int(option) - 1].flight_id
+        elif any(f.flight_id == option for f in options):
+            flight_id = option
+        else:
+            return None
+
+        try:
+            result = await self.call_tool(
+                "set_selected_flight", {"session_id": session.session_id, "flight_id": flight_id}
+            )
+        except ValueError:
+            # Raised in process; over MCP the rejection comes back as error text
+            result = None
+        if not str(result).startswith(f"Flight {flight_id} selected"):
+            metrics.incr("flights.selection_rejected")
+            return None
+        session.stage = SUMMARY
+        session.revision += 1
+        session.selected_revision = session.route_revision
+        # The selection is one known write, not a change another writer made
+        if session.server_version is not None:
+            session.server_version += 1
+        self._speculate_summary(session)
+        return result
+
+    def _speculate_summary(self, session):
+        prose = SUMMARY_MODE == "llm"
+        self._speculate(
+            session, "summary", (session.revision, prose), self._build_summary, session.session_id, prose
+        )
+
+    async def summarize(self, session, on_token=None, prose=None):
+        """Return the booking summary, cached on the server's context fingerprint.
+
+        The summary is rendered from a template unless ``prose`` (or
+        SUMMARY_MODE=llm) asks for the summary agent's free-form output.
+        """
+        if prose is None:
+            prose = SUMMARY_MODE == "llm"
+        summary = await self._speculated(session, "summary", (session.revision, prose))
+        if summary is None:
+            try:
+                with self._streaming(on_token):
+                    summary = await asyncio.to_thread(self._build_summary, session.session_id, prose)
+            except Exception:
+                if not prose:
+                    raise
+                # The template needs no model, so a failed summary agent costs only the prose
+                metrics.incr("summary.llm_fallbacks")
+                summary = await asyncio.to_thread(self._build_summary, session.session_id, False)
+        session.summary = summary
+        return summary
+
+    def _build_summary(self, session_id, prose):
+        fingerprint = self.tools.call("get_context_fingerprint", {"session_id": session_id})
+        key = (fingerprint, prose)
+        summary = self.summary_cache.get(key)
+        if summary is None:
+            if prose:
+                # Unfilled fields carry nothing the summary agent needs
+                inputs, report = self.prompts.summary(self.tools.get_filled_context(session_id))
+                result = self.registry.kickoff("confirm_summary_node", inputs)
+                self._record_usage(report, result)
+                summary = result.raw
+            else:
+                summary = render_summary(self.tools.get_context(session_id).to_wire())
+            self.summary_cache.put(key, summary)
+        return summary
+
+    async def confirm(self, session):
+        """Queue the booking for approval; the server returns before anything is sent."""
+        self._cancel_speculation(session)
+        try:
+            receipt = await asyncio.to_thread(self.tools.confirm_booking, session.session_id)
+        except ValueError as e:
+            # Incomplete booking, or the server's error text
+            return f"The booking could not be confirmed: {e}"
+        session.stage = DONE
+        if not receipt.queued:
+            return f"This booking was already confirmed (request {receipt.idempotency_key}, {receipt.status})."
+        return f"Booking confirmed. Travel request {receipt.idempotency_key} is queued for approval."
+
+    async def edit(self, session):
+        """Ask for a correction; flight options and the summary are kept until it is applied."""
+        if session.stage != EDIT:
+            session.edit_from = session.stage
+        session.stage = EDIT
+        session.last_question = "What would you like to edit? (for example: approver name is Ravi Menon)"
+        return TurnResult(EDIT, session.last_question, session.pending)
+
+    async def apply_edit(self, session, user_input, on_token=None):
+        """Update the fields a correction names and recompute only the stages that read them.
+
+        A plainly worded correction is resolved by the fast path; anything
+        else goes to the edit handler agent as one structured completion.
+        A route change invalidates the flight options (and so the selected
+        flight); any change invalidates the summary. Output of stages the
+        edit does not touch is kept.
+        """
+        with span("turn", turn_id=new_turn_id(), session_id=session.session_id, kind="edit"):
+            metrics.incr("turns.edit")
+            updates, errors, report = await self._resolve_edit(session, user_input, on_token)
+            prompt_tokens = report.tokens if report is not None else 0
+            if not updates:
+                errors = errors or {"input": "Could not tell which field to change; please name it."}
+                return TurnResult(EDIT, session.last_question, session.pending, errors=errors, prompt_tokens=prompt_tokens)
+
+            turn = await self._advance(session, updates)
+            turn.errors = {**errors, **turn.errors}
+            turn.prompt_tokens = prompt_tokens
+            if session.stage == QUESTIONS:
+                # The edit made more fields required, e.g. accommodation
+                return turn
+
+            stale = invalidated_stages(turn.changed)
+            for stage in STAGE_INPUTS:
+                metrics.incr(f"edit.{'recomputed' if stage in stale else 'reused'}.{stage}")
+            if FLIGHTS in stale:
+                session.flight_options = None
+            if SUMMARY in stale:
+                session.summary = None
+            if FLIGHTS in stale or session.edit_from == FLIGHTS or not session.flight_options:
+                session.stage = FLIGHTS
+                turn.message = "Booking updated. Let's pick a flight for it..."
+            elif SUMMARY in stale:
+                session.stage = SUMMARY
+                self._speculate_summary(session)
+                turn.message = f"Updated {', '.join(turn.changed)}."
+            else:
+                session.stage = SUMMARY
+                turn.message = "Nothing changed."
+            turn.stage = session.stage
+            return turn
+
+    async def _resolve_edit(self, session, user_input, on_token=None):
+        """``(updates, errors, prompt report)`` for a correction."""
+        resolved = self.fast_path.match_edit(user_input, FIELD_ORDER)
+        if resolved is not None:
+            metrics.incr("edit.resolved.fast_path")
+            field_name, value = resolved
+            return {field_name: value}, {}, None
+
+        filled = await asyncio.to_thread(self.tools.get_filled_context, session.session_id)
+        try:
+            messages, report = self.prompts.structured_edit(user_input, filled, response_schema(FIELD_ORDER))
+        except ValueError as e:
+            return {}, {"input": str(e)}, None
+        try:
+            with self._streaming(on_token):
+                reply = await asyncio.to_thread(self.registry.call, "edit_handler_agent", messages)
+        except Exception as e:
+            metrics.incr("turns.model_errors")
+            return {}, {"model": model_error(e)}, report
+        metrics.incr("edit.resolved.llm")
+        metrics.incr(f"prompt.calls.{report.task}")
+        metrics.incr(f"prompt.tokens.{report.task}", report.tokens)
+        try:
+            updates, errors = validate_reply(parse_reply(reply))
+        except ValueError as e:
+            updates, errors = {}, {"input": str(e)}
+        return updates, errors, report
@@ -0,0 +1,73 @@
+"""Single-call structured extraction.
+
+The extraction model is asked once for a JSON object keyed by the pending
+field paths, each constrained to its options. The reply is validated here
+against the booking schema; valid values are applied in one batch and
+invalid ones are reported back to the user instead of being retried.
+"""
+import json
+import os
+import re
+
+from crew_ai_mcp_poc.servers.schema import FIELD_SPECS, VALID_FIELD_OPTIONS
+
+# "structured": one JSON completion per turn; "agent": the tool-calling crew task
+EXTRACTION_MODE = os.getenv("EXTRACTION_MODE", "structured")
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.DOTALL)
+
+
+def response_schema(fields):
+    """JSON schema for a reply that may set any of ``fields``."""
+    properties = {}
+    for path in fields:
+        spec = FIELD_SPECS.get(path)
+        if spec is None:
+            continue
+        prop = {"type": "string"}
+        if path in VALID_FIELD_OPTIONS:
+            prop["enum"] = VALID_FIELD_OPTIONS[path]
+        elif spec.is_date:
+            prop["pattern"] = r"^\d{2}/\d{2}/\d{4}$"
+        properties[path] = prop
+    return {"type": "object", "properties": properties, "additionalProperties": False}
+
+
+def parse_reply(text):
+    """The JSON object in a model reply, tolerating code fences and surrounding prose."""
+    match = _JSON_OBJECT.search(text or "")
+    if match is None:
+        raise ValueError("The extraction reply holds no JSON object")
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        raise ValueError(f"The extraction reply is not valid JSON: {e}")
+    if not isinstance(data, dict):
+        raise ValueError("The extraction reply is not a JSON object")
+    return data
+
+
+def validate_reply(data):
+    """Split a parsed reply into valid updates and per-field error messages.
+
+    Empty values are dropped; option values are normalised to the schema's
+    spelling so the server stores them consistently.
+    """
+    updates, errors = {}, {}
+    for path, value in data.items():
+        if value is None or not str(value).strip():
+            continue
+        spec = FIELD_SPECS.get(path)
+        if spec is None:
+            errors[path] = f"Unknown field '{path}'"
+            continue
+        value = str(value).strip()
+        try:
+            spec.validate(value)
+        except ValueError as e:
+            errors[path] = str(e)
+            continue
+        if spec.options:
+            value = next(option for option in spec.options if option.lower() == value.lower())
+        updates[path] = value
+    return updates, errors
@@ -0,0 +1,147 @@
+import json
+import re
+import threading
+from datetime import datetime
+
+# Common ways of answering an option question, mapped onto the canonical option
+OPTION_SYNONYMS = {
+    "yes": ["y", "yeah", "yep", "yup", "sure", "ok", "okay", "yes please", "required"],
+    "no": ["n", "nope", "nah", "no thanks", "not required"],
+    "round trip": ["roundtrip", "return", "return trip", "two way"],
+    "one way": ["oneway", "single", "single trip"],
+    "multicity": ["multi city", "multiple cities"],
+    "air": ["flight", "by air", "plane", "fly", "by flight", "aeroplane"],
+}
+
+DATE_PATTERN = re.compile(r"^(\d{1,2})[/.-](\d{1,2})[/.-](\d{4})$")
+
+# "<field> to|is|: <value>", optionally led by "change the" and similar
+EDIT_PATTERN = re.compile(
+    r"^(?:please\s+)?(?:(?:change|update|set|edit|make)\s+)?(?:the\s+|my\s+)?"
+    r"(?P<field>[a-z][a-z .]*?)\s*(?:\s(?:to|is|should be)\s|[:=])\s*(?P<value>.+)$",
+    re.IGNORECASE,
+)
+
+# Everyday names for fields, on top of their split camelCase names
+FIELD_ALIASES = {
+    "origin": "travelPlan.leavingFrom",
+    "destination": "travelPlan.goingTo",
+    "date": "travelPlan.departureDate",
+    "travel date": "travelPlan.departureDate",
+    "project": "registererDetails.projectOrOpportunity",
+    "purpose": "travelPlan.travelPurpose",
+    "passenger": "passengerDetails.passengerName",
+    "approver": "approver.approverName",
+}
+
+
+def next_pending_field(pending):
+    # MCP tool results arrive either decoded or as the text of the first item
+    if not pending:
+        return None
+    if isinstance(pending, str):
+        return pending
+    return pending[0]
+
+
+def field_words(path):
+    """``approver.approverName`` -> ``approver name``."""
+    return re.sub(r"(?<=[a-z])(?=[A-Z])", " ", path.rsplit(".", 1)[-1]).lower()
+
+
+def normalise(text):
+    text = text.strip().lower().replace("-", " ").replace("_", " ")
+    text = re.sub(r"[!?.,;:]+$", "", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class FastPathExtractor:
+    """Rule-based extraction for answers that need no LLM.
+
+    Keyed to the field that was just asked, it only fires when the answer is
+    an allowed option (or a known synonym) or a dd/mm/yyyy date. Free-text
+    answers, however short, are left to the extraction crew: "Not sure yet"
+    or "Same as before" look like names but are not.
+    """
+
+    def __init__(self, field_options):
+        self.field_options = {f: [o.lower() for o in opts] for f, opts in field_options.items()}
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_server(cls, tools, run_tool):
+        options = run_tool(tools, "get_field_options", {}) or {}
+        if isinstance(options, str):
+            options = json.loads(options)
+        return cls(options)
+
+    def match(self, field, user_input):
+        if not field or not user_input or not user_input.strip():
+            return None
+
+        if field in self.field_options:
+            return self._match_option(field, normalise(user_input))
+        if "Date" in field or field.endswith(("checkIn", "checkOut")):
+            return self._match_date(user_input.strip())
+        return None
+
+    def _match_option(self, field, answer):
+        options = self.field_options[field]
+        if answer in options:
+            return answer
+        for option in options:
+            if answer in OPTION_SYNONYMS.get(option, ()):
+                return option
+        return None
+
+    def _match_date(self, answer):
+        m = DATE_PATTERN.match(answer)
+        if not m:
+            return None
+        value = f"{int(m.group(1)):02d}/{int(m.group(2)):02d}/{m.group(3)}"
+        try:
+            datetime.strptime(value, "%d/%m/%Y")
+        except ValueError:
+            return None
+        return value
+
+    def match_edit(self, user_input, fields):
+        """``(field, value)`` for a correction that names one of ``fields`` plainly, else None.
+
+        "change the trip type to one way" resolves without an LLM; the value
+        must pass the same checks as a fast-path answer, so corrections to
+        free-text fields go to the extraction crew.
+        """
+        m = EDIT_PATTERN.match(user_input.strip()) if user_input else None
+        if m is None:
+            return None
+        phrase = normalise(m.group("field"))
+        names = {field_words(f): f for f in fields}
+        names.update({alias: f for alias, f in FIELD_ALIASES.items() if f in fields})
+        names.update({f.lower(): f for f in fields})
+        field = names.get(phrase)
+        if field is None:
+            return None
+        value = self.match(field, m.group("value"))
+        return (field, value) if value is not None else None
+
+    def record(self, matched, accepted):
+        with self._lock:
+            self.attempts += 1
+            if accepted:
+                self.hits += 1
+            elif matched:
+                self.rejected += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "attempts": self.attempts,
+                "hits": self.hits,
+                "rejected": self.rejected,
+                "llm_fallbacks": self.attempts - self.hits,
+                "hit_rate": self.hits / self.attempts if self.attempts else 0.0,
+            }
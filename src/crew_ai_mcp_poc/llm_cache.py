@@ -0,0 +1,207 @@
+"""Response cache for LLM extraction results.
+
+Entries are keyed on the normalised (asked field, user input, model) and
+hold the field updates the extraction agent made, so a repeated answer
+can be applied without an LLM call. Backends are tried in order; a hit in
+a later one is copied into the earlier ones.
+"""
+from collections import OrderedDict
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from crew_ai_mcp_poc.fast_path import normalise
+
+# Comma-separated backend names, fastest first; empty disables the cache
+LLM_CACHE_BACKENDS = os.getenv("LLM_CACHE", "memory,sqlite")
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".llm_cache.db")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "10000"))
+
+
+def cache_key(field, user_input, model):
+    raw = "\0".join((model or "", field or "", normalise(user_input)))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """LRU of (expiry, value) pairs."""
+
+    name = "memory"
+
+    def __init__(self, max_size=LLM_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, value, expires):
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """Entries on disk, shared by every process that opens the same file.
+
+    Expired rows are skipped on read and deleted, together with the least
+    recently used rows over ``max_size``, after every ``prune_every`` writes.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=LLM_CACHE_PATH, max_size=LLM_CACHE_SIZE, prune_every=100):
+        self.max_size = max_size
+        self.prune_every = prune_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+        """)
+
+    def get(self, key, now):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM responses WHERE key = ? AND expires > ?", (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key, value, expires):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), expires, now),
+            )
+            self._writes += 1
+            if self._writes >= self.prune_every:
+                self._writes = 0
+                self._prune(now)
+
+    def _prune(self, now):
+        self._conn.execute("BEGIN")
+        self._conn.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        self._conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            " SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,),
+        )
+        self._conn.execute("COMMIT")
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+BACKENDS = {
+    "memory": MemoryBackend,
+    "sqlite": SQLiteBackend,
+}
+
+
+class ResponseCache:
+    """Tiered cache with TTL; safe to share between concurrent sessions."""
+
+    def __init__(self, backends, ttl_seconds=LLM_CACHE_TTL):
+        self.backends = backends
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.hits = {backend.name: 0 for backend in backends}
+        self.misses = 0
+
+    def get(self, key):
+        now = time.time()
+        for i, backend in enumerate(self.backends):
+            value = backend.get(key, now)
+            if value is not None:
+                for earlier in self.backends[:i]:
+                    earlier.put(key, value, now + self.ttl_seconds)
+                with self._lock:
+                    self.hits[backend.name] += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        expires = time.time() + self.ttl_seconds
+        for backend in self.backends:
+            backend.put(key, value, expires)
+
+    def stats(self):
+        with self._lock:
+            hits = sum(self.hits.values())
+            lookups = hits + self.misses
+            return {
+                "hits": dict(self.hits),
+                "misses": self.misses,
+                "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": {backend.name: backend.size() for backend in self.backends},
+            }
+
+    def close(self):
+        for backend in self.backends:
+            backend.close()
+
+
+def open_cache(backends=LLM_CACHE_BACKENDS):
+    names = [name.strip() for name in backends.split(",") if name.strip()]
+    if not names:
+        return None
+    unknown = [name for name in names if name not in BACKENDS]
+    if unknown:
+        raise ValueError(f"Unknown LLM cache backend(s): {', '.join(unknown)}")
+    return ResponseCache([BACKENDS[name]() for name in names])
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_shared_cache():
+    """The process-wide cache from LLM_CACHE, or None when it is disabled."""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = open_cache() or False
+            if _shared_cache:
+                atexit.register(_shared_cache.close)
+        return _shared_cache or None
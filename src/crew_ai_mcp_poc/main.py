@@ -1,123 +1,240 @@
-import os
-from crewai import Crew, Task
-from crew_ai_mcp_poc.crew import build_crew, run_extraction_task
-from crew_ai_mcp_poc.tools.mcp_adapter import get_mcp_tools
-
-def get_tool(tools, name):
-    return next(tool for tool in tools if tool.name == name)
-
-def run_tool(tools, tool_name, input_dict):
-    tool = get_tool(tools, tool_name)
-    if tool is None:
-        raise ValueError(f"Tool '{tool_name}' not found.")
-    try:
-        return tool.run(input_dict)
-    except IndexError:
-        return None
+import asyncio
+from contextlib import contextmanager
+import json
+import subprocess
+import sys
+import time
+from crew_ai_mcp_poc.engine import (
+    BookingEngine, BookingSession, EXIT_COMMANDS, QUESTIONS, FLIGHTS, SUMMARY, EDIT, DONE, decode_result, format_flight,
+)
+from crew_ai_mcp_poc.telemetry import metrics
+from crew_ai_mcp_poc.tools.mcp_adapter import get_mcp_tools, release_mcp_tools
+
+# Typed at any question prompt to dump client and server metrics
+METRICS_COMMAND = "metrics"
+PROFILE_FLAG = "--profile-startup"
+
+# Values for every placeholder in tasks.yaml, for train and test runs
+SAMPLE_INPUTS = {
+    "user_input": "book a flight from Pune to Delhi on 12/06/2026 for client work",
+    "field": "travelPlan.leavingFrom",
+    "options": "",
+    "other_fields": "",
+    "context": "{}",
+}
+
+async def ainput(prompt):
+    return await asyncio.to_thread(input, prompt)
+
+def print_token(chunk):
+    print(chunk, end="", flush=True)
+
+async def print_metrics(engine):
+    server = decode_result(await engine.call_tool("get_metrics"))
+    report = {"client": metrics.dump(), "server": server}
+    if "get_approval_queue_stats" in engine.tools:
+        report["approvals"] = decode_result(await engine.call_tool("get_approval_queue_stats"))
+    if engine.llm_cache is not None:
+        report["llm_cache"] = engine.llm_cache.stats()
+    print(json.dumps(report, indent=2))
+
+def main(session_id=None):
+    print(" Hi! I'm your Travel Booking Assistant.")
+    if session_id:
+        print(f"Resuming your booking {session_id}...\n")
+    else:
+        confirm = input("Would you like to start a new booking? (yes/no) You: ").strip().lower()
 
-def get_task_by_description(crew, phrase):
-    return next((t for t in crew.tasks if phrase.lower() in t.description.lower()), None)
+        if confirm != "yes":
+            print("No problem! Come back anytime.")
+            return
 
-def main():
-    print(" Hi! I'm your Travel Booking Assistant.")
-    confirm = input("Would you like to start a new booking? (yes/no) You: ").strip().lower()
+        print("Great! Let's get started with your travel booking...\n")
 
-    if confirm != "yes":
-        print("No problem! Come back anytime.")
+    connection = get_mcp_tools()
+    try:
+        engine = BookingEngine(connection.client())
+        asyncio.run(run_booking(engine, BookingSession(session_id)))
+    finally:
+        release_mcp_tools(connection)
+
+def run():
+    """Console entry point: `run_crew [--resume SESSION_ID | --profile-startup]`."""
+    args = sys.argv[1:]
+    if args and args[0] == PROFILE_FLAG:
+        profile_startup()
         return
+    session_id = None
+    if len(args) >= 2 and args[0] == "--resume":
+        session_id = args[1]
+    main(session_id)
+
+def import_breakdown(module="crew_ai_mcp_poc.main"):
+    """Self import time per top-level package, in seconds, from `python -X importtime`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    totals = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        package = name.strip().split(".")[0]
+        totals[package] = totals.get(package, 0.0) + int(self_us) / 1e6
+    return dict(sorted(totals.items(), key=lambda item: item[1], reverse=True))
+
+def profile_startup(top=15):
+    """Print where time to the first question goes: imports, then each startup step."""
+    imports = import_breakdown()
+    print(f"Import crew_ai_mcp_poc.main: {sum(imports.values()):.3f}s")
+    for package, seconds in list(imports.items())[:top]:
+        print(f"  {package:<30} {seconds:.3f}s")
+
+    steps = {}
+    started = time.perf_counter()
+    connection = get_mcp_tools()
+    steps["connect to context server"] = time.perf_counter() - started
+    try:
+        started = time.perf_counter()
+        engine = BookingEngine(connection.client())
+        steps["create engine"] = time.perf_counter() - started
+        session = BookingSession()
+        started = time.perf_counter()
+        asyncio.run(engine.start(session))
+        steps["first question"] = time.perf_counter() - started
+        # Not on the path to the first question; paid by the first LLM turn
+        started = time.perf_counter()
+        engine.registry
+        steps["build crew (deferred)"] = time.perf_counter() - started
+        engine.tools.call("reset_state", {"session_id": session.session_id})
+    finally:
+        release_mcp_tools(connection)
+    print("Startup steps:")
+    for step, seconds in steps.items():
+        print(f"  {step:<30} {seconds:.3f}s")
+
+@contextmanager
+def leased_crew():
+    """The full sequential crew over a leased context server connection."""
+    from crew_ai_mcp_poc.crew import build_crew
+    connection = get_mcp_tools()
+    try:
+        yield build_crew(connection.tools)
+    finally:
+        release_mcp_tools(connection)
 
-    print("Great! Let's get started with your travel booking...\n")
+def sample_inputs():
+    return {**SAMPLE_INPUTS, "session_id": f"train-{time.time_ns()}"}
 
-    crew = build_crew()
-    tools = get_mcp_tools().tools
+def train():
+    """Console entry point: `train N_ITERATIONS FILENAME`."""
+    if len(sys.argv) < 3:
+        sys.exit("Usage: train N_ITERATIONS FILENAME")
+    try:
+        with leased_crew() as crew:
+            crew.train(n_iterations=int(sys.argv[1]), filename=sys.argv[2], inputs=sample_inputs())
+    except Exception as e:
+        raise Exception(f"An error occurred while training the crew: {e}")
+
+def replay():
+    """Console entry point: `replay TASK_ID`."""
+    if len(sys.argv) < 2:
+        sys.exit("Usage: replay TASK_ID")
+    try:
+        with leased_crew() as crew:
+            crew.replay(task_id=sys.argv[1])
+    except Exception as e:
+        raise Exception(f"An error occurred while replaying the crew: {e}")
+
+def test():
+    """Console entry point: `test N_ITERATIONS EVAL_LLM`."""
+    if len(sys.argv) < 3:
+        sys.exit("Usage: test N_ITERATIONS EVAL_LLM")
+    try:
+        with leased_crew() as crew:
+            crew.test(n_iterations=int(sys.argv[1]), eval_llm=sys.argv[2], inputs=sample_inputs())
+    except Exception as e:
+        raise Exception(f"An error occurred while testing the crew: {e}")
+
+async def run_booking(engine, session):
+    turn = await engine.start(session)
 
     while True:
-        question = run_tool(tools, "get_next_question", {})
-        if not question:
-            print("Unable to generate the next question.")
-            break
-
-        print(f"Bot: {question}")
-        user_input = input("You: ")
-
-        if user_input.strip().lower() in ["exit", "quit"]:
-            print("Goodbye! Your session is saved. You can continue later.")
-            break
-
-        print("Extracting field from your input...")
-        result = run_extraction_task(user_input, tools)
-        print("Result:", result)
-
-        pending = run_tool(tools, "get_pending_fields", {}) or []
-
-        if not pending:
-            print("All fields are collected! Let's move to booking options...\n")
-
-            # 1. Suggest mock options using existing task
-            booking_task = get_task_by_description(crew, "mock flight options")
-            if booking_task:
-                print("Suggesting flight options...")
-                booking_result = Crew(
-                    agents=[booking_task.agent],
-                    tasks=[booking_task],
-                    tools=tools,
-                ).kickoff()
-                print("Options:\n", booking_result)
-
-                # 2. Ask user to pick flight
-                selected = input("Please select a flight option (1/2/3): ").strip()
-
-                # 3. Create an ad-hoc task to update MCP using agent
-                print("Updating selected flight in context...")
-                flight_update_task = Task(
-                    description=f"The user selected flight option {selected}. Use the `set_selected_flight` tool to update MCP context.",
-                    expected_output="Context updated with the selected flight.",
-                    agent=booking_task.agent,
-                    tools=tools
-                )
-
-                flight_update_result = Crew(
-                    agents=[booking_task.agent],
-                    tasks=[flight_update_task],
-                    tools=tools,
-                ).kickoff(inputs={"selected_option": selected})
-
-                print("Flight saved:", flight_update_result)
-
-            # 3. Summary + confirmation loop
-            while True:
-                summary_task = get_task_by_description(crew, "travel summary agent")
-                if not summary_task:
-                    print(" No summary task found. Check task config.")
-
-                else:
-                    print(" Generating booking summary...")
-                    context = run_tool(tools, "get_context", {})
-                    context_str = str(context)
-                    summary_result = Crew(
-                        agents=[summary_task.agent],
-                        tasks=[Task(
-                            description=(
-                                f"Here is the booking context:\n\n{context_str}\n\n"
-                                "Summarize the full booking in JSON, including selected flight details, and ask for confirmation."
-                ),
-                            expected_output="Full summary JSON including selected flight details + prompt to confirm or edit.",
-                            agent=summary_task.agent,
-                            tools=tools,
-                        )]
-                    ).kickoff()
-                    print(" Booking Summary:\n", summary_result)
-
-                # 4. User confirms or edits
-                confirm = input("\n Confirm this booking? (yes/edit): ").strip().lower()
-                if confirm == "yes":
-                    print(" Booking confirmed. Travel request is sent for approval.")
+        if session.stage == QUESTIONS:
+            if not session.last_question:
+                print("Unable to generate the next question.")
+                return
+
+            print(f"Bot: {session.last_question}")
+            user_input = await ainput("You: ")
+
+            if user_input.strip().lower() in EXIT_COMMANDS:
+                print("Goodbye! Your session is saved. You can continue later.")
+                print(f"Resume it with: run_crew --resume {session.session_id}")
+                return
+            if user_input.strip().lower() == METRICS_COMMAND:
+                await print_metrics(engine)
+                continue
+
+            print("Extracting field from your input...")
+            turn = await engine.answer(session, user_input, on_token=print_token)
+            for field, error in turn.errors.items():
+                print(f" {field}: {error}")
+            if session.stage == QUESTIONS:
+                print(" Pending fields left:", turn.pending)
+            else:
+                print(turn.message + "\n")
+
+        elif session.stage == FLIGHTS:
+            # 1. Suggest options from the flight index
+            print("Suggesting flight options...")
+            options = await engine.suggest_flights(session)
+            if not options:
+                print("No flights found for this route and date.")
+                turn = await engine.edit(session)
+                continue
+            print("Options:")
+            for i, flight in enumerate(options, 1):
+                print(f" {i}. {format_flight(flight)}")
+
+            # 2. Ask user to pick flight
+            choices = "/".join(str(i) for i in range(1, len(options) + 1))
+            selected = (await ainput(f"Please select a flight option ({choices}): ")).strip()
+
+            # 3. Save the selection by flight id
+            saved = await engine.select_flight(session, selected)
+            if saved is None:
+                print("Invalid flight option.")
+                continue
+            print("Flight saved:", saved)
+
+        elif session.stage == SUMMARY:
+            print(" Generating booking summary...")
+            print(" Booking Summary:\n", await engine.summarize(session, on_token=print_token))
+
+            # 4. User confirms or edits
+            confirm = (await ainput("\n Confirm this booking? (yes/edit): ")).strip().lower()
+            if confirm == "yes":
+                print(" " + await engine.confirm(session))
+                if session.stage == DONE:
                     return
-                else:
-                    print(" What would you like to edit?")
-                    break  # Go back to question-answer loop
+                continue
+            turn = await engine.edit(session)
+
+        elif session.stage == EDIT:
+            # 5. Apply one correction; only the stages it affects are redone
+            print(f"Bot: {session.last_question}")
+            user_input = await ainput("You: ")
+            turn = await engine.apply_edit(session, user_input, on_token=print_token)
+            for field, error in turn.errors.items():
+                print(f" {field}: {error}")
+            if session.stage != EDIT:
+                print(turn.message)
+
         else:
-            print(" Pending fields left:", pending)
+            return
 
 
 if __name__ == "__main__":
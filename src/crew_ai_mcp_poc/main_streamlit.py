@@ -1,35 +1,58 @@
+import asyncio
+import os
+from collections import deque
 import streamlit as st
-from crewai import Crew, Task
-from crew_ai_mcp_poc.crew import build_crew, run_extraction_task
+from crew_ai_mcp_poc.engine import (
+    BookingEngine, BookingSession, EXIT_COMMANDS, WELCOME, QUESTIONS, FLIGHTS, SUMMARY, EDIT, DONE, decode_result, format_flight,
+)
+from crew_ai_mcp_poc.telemetry import metrics
+from crew_ai_mcp_poc.tools.client import ContextMirror
 from crew_ai_mcp_poc.tools.mcp_adapter import get_mcp_tools
 
-def get_tool(tools, name):
-    return next((tool for tool in tools if tool.name == name), None)
+# Older messages are dropped so long sessions keep a flat memory footprint
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "200"))
 
-def run_tool(tools, tool_name, input_dict):
-    tool = get_tool(tools, tool_name)
-    if tool is None:
-        raise ValueError(f"Tool '{tool_name}' not found.")
-    try:
-        return tool.run(input_dict)
-    except IndexError:
-        return None
+@st.cache_resource
+def get_shared_engine():
+    """One MCP connection, crew registry and engine for every browser session.
 
-def get_task_by_description(crew, phrase):
-    return next((t for t in crew.tasks if phrase.lower() in t.description.lower()), None)
+    Bookings are keyed by session id on the server, so the engine holds no
+    per-user state. The connection returns to the pool when the process exits,
+    and is respawned in place if its server dies.
+    """
+    return BookingEngine(get_mcp_tools().client())
+
+def run_streaming(coro_fn, *args):
+    """Run an engine coroutine, rendering streamed tokens into a placeholder."""
+    placeholder = st.empty()
+    chunks = []
+
+    def on_token(chunk):
+        chunks.append(chunk)
+        placeholder.markdown("".join(chunks))
+
+    result = asyncio.run(coro_fn(*args, on_token=on_token))
+    placeholder.empty()
+    return result
+
+def say(role, message):
+    st.session_state.chat_history.append((role, message))
+    st.chat_message(role).write(message)
 
 # ---------- SESSION STATE SETUP ----------
 if "initialized" not in st.session_state:
     st.session_state.initialized = True
-    st.session_state.crew = build_crew()
-    st.session_state.tools = get_mcp_tools().tools
-    st.session_state.pending_fields = []
-    st.session_state.flight_selected = False
-    st.session_state.stage = "welcome"  # Start with welcome
-    st.session_state.chat_history = []
-    st.session_state.last_question = ""
-    st.session_state.user_input = ""
+    # A ?session=<id> query parameter resumes a saved booking
+    resume_id = st.query_params.get("session")
+    st.session_state.booking = BookingSession(resume_id)  # Starts in the welcome stage
+    st.session_state.chat_history = deque(maxlen=CHAT_HISTORY_LIMIT)
     st.session_state.booking_started = False
+    if resume_id:
+        st.session_state.booking.stage = QUESTIONS
+    st.query_params["session"] = st.session_state.booking.session_id
+
+engine = get_shared_engine()
+booking = st.session_state.booking
 
 # ---------- UI START ----------
 st.title("✈️ Travel Booking Assistant")
@@ -39,170 +62,173 @@ for role, message in st.session_state.chat_history:
     st.chat_message(role).write(message)
 
 # ---------- WELCOME STAGE ----------
-if st.session_state.stage == "welcome":
+if booking.stage == WELCOME:
     if not st.session_state.booking_started:
-        st.chat_message("assistant").write("Hi! I'm your Travel Booking Assistant.")
-        st.session_state.chat_history.append(("assistant", "Hi! I'm your Travel Booking Assistant."))
-        
+        if not st.session_state.chat_history:
+            say("assistant", "Hi! I'm your Travel Booking Assistant.")
+
         if st.button("Start New Booking"):
             st.session_state.booking_started = True
             st.session_state.chat_history.append(("user", "Yes, start new booking"))
             st.session_state.chat_history.append(("assistant", "Great! Let's get started with your travel booking..."))
-            st.session_state.stage = "questions"
+            booking.stage = QUESTIONS
             st.rerun()
         
         if st.button("No, Maybe Later"):
-            st.chat_message("assistant").write("No problem! Come back anytime.")
-            st.session_state.chat_history.append(("assistant", "No problem! Come back anytime."))
+            say("assistant", "No problem! Come back anytime.")
             st.stop()
 
 # ---------- QUESTION/ANSWER LOOP ----------
-elif st.session_state.stage == "questions":
+elif booking.stage == QUESTIONS:
     # Step 1: Ask first or next question
-    if st.session_state.last_question == "":
-        question = run_tool(st.session_state.tools, "get_next_question", {})
-        if question:
-            st.session_state.last_question = question
-            st.session_state.chat_history.append(("assistant", question))
-            st.chat_message("assistant").write(question)
+    if booking.last_question == "":
+        asyncio.run(engine.start(booking))
+        if booking.last_question:
+            say("assistant", booking.last_question)
         else:
             st.error("Unable to generate the next question.")
-            st.session_state.stage = "flights"
+            booking.stage = FLIGHTS
 
     # Step 2: Show input box and wait for user response
     user_input = st.chat_input("Your answer:")
     if user_input:
         # Handle exit commands
-        if user_input.strip().lower() in ["exit", "quit"]:
-            st.chat_message("assistant").write("Goodbye! Your session is saved. You can continue later.")
-            st.session_state.chat_history.append(("assistant", "Goodbye! Your session is saved. You can continue later."))
+        if user_input.strip().lower() in EXIT_COMMANDS:
+            say("assistant", "Goodbye! Your session is saved. You can continue later.")
             st.stop()
             
         st.session_state.chat_history.append(("user", user_input))
 
         # Step 3: Extract fields
         with st.spinner("🧠 Extracting field from your input..."):
-            result = run_extraction_task(user_input, st.session_state.tools)
-            # st.write("Result:", result)
-            st.session_state.pending_fields = run_tool(st.session_state.tools, "get_pending_fields", {}) or []
+            turn = run_streaming(engine.answer, booking, user_input)
+        for field, error in turn.errors.items():
+            say("assistant", f"{field}: {error}")
 
         # Step 4: Continue or move to next stage
-        if not st.session_state.pending_fields:
-            st.success("All fields are collected! Let's move to booking options...")
-            st.session_state.stage = "flights"
+        if booking.stage != QUESTIONS:
+            st.success(turn.message)
             st.rerun()
-        else:
-            # st.info(f"Pending fields left: {st.session_state.pending_fields}")
-            question = run_tool(st.session_state.tools, "get_next_question", {})
-            if question:
-                st.session_state.last_question = question
-                st.session_state.chat_history.append(("assistant", question))
-                st.chat_message("assistant").write(question)
+        elif booking.last_question:
+            # st.info(f"Pending fields left: {turn.pending}")
+            say("assistant", booking.last_question)
 
 # ---------- FLIGHT SELECTION ----------
-elif st.session_state.stage == "flights":
+elif booking.stage == FLIGHTS:
     st.subheader("✈️ Flight Options")
 
-    booking_task = get_task_by_description(st.session_state.crew, "mock flight options")
-    if booking_task:
+    # Searched once per visit to this stage; widget reruns reuse the options
+    if booking.flight_options is None:
         with st.spinner("Suggesting flight options..."):
-            booking_result = Crew(
-                agents=[booking_task.agent],
-                tasks=[booking_task],
-                tools=st.session_state.tools,
-            ).kickoff()
-
-        st.session_state.chat_history.append(("assistant", f"Options:\n{booking_result.raw}"))
-        st.markdown("Here are some flight options:\n\n" + str(booking_result.raw))
+            asyncio.run(engine.suggest_flights(booking))
+        if booking.flight_options:
+            labels = [f"{i}. {format_flight(flight)}" for i, flight in enumerate(booking.flight_options, 1)]
+            st.session_state.chat_history.append(("assistant", "Options:\n" + "\n".join(labels)))
+
+    options = booking.flight_options
+    if not options:
+        st.error("No flights found for this route and date.")
+        if st.button("✏️ Edit Booking"):
+            turn = asyncio.run(engine.edit(booking))
+            st.session_state.chat_history.append(("assistant", turn.message))
+            st.rerun()
+    else:
+        labels = [f"{i}. {format_flight(flight)}" for i, flight in enumerate(options, 1)]
+        st.markdown("Here are some flight options:\n\n" + "\n".join(labels))
 
-        selected = st.selectbox("Please select a flight option:", ["1", "2", "3"], key="flight_selector")
+        selected = st.selectbox("Please select a flight option:", labels, key="flight_selector")
         if st.button("Select Flight"):
             with st.spinner("Updating selected flight in context..."):
-                # Create an ad-hoc task to update MCP using agent
-                flight_update_task = Task(
-                    description=f"The user selected flight option {selected}. Use the `set_selected_flight` tool to update MCP context.",
-                    expected_output="Context updated with the selected flight.",
-                    agent=booking_task.agent,
-                    tools=st.session_state.tools
-                )
-
-                flight_update_result = Crew(
-                    agents=[booking_task.agent],
-                    tasks=[flight_update_task],
-                    tools=st.session_state.tools,
-                ).kickoff(inputs={"selected_option": selected})
-
+                option = str(labels.index(selected) + 1)
+                flight_update_result = asyncio.run(engine.select_flight(booking, option))
+
+            if flight_update_result is None:
+                # The server rejected it, e.g. the route changed; search again on the next run
+                st.error("That flight does not match your booking any more. Please pick again.")
+                booking.flight_options = None
+            else:
                 st.success(f"Flight saved: {flight_update_result}")
-                st.session_state.chat_history.append(("user", f"Selected flight option {selected}"))
+                st.session_state.chat_history.append(("user", f"Selected flight option {option}"))
                 st.session_state.chat_history.append(("assistant", f"Flight saved: {flight_update_result}"))
-                st.session_state.stage = "summary"
                 st.rerun()
-    else:
-        st.error("No booking task found. Check task configuration.")
 
 # ---------- BOOKING SUMMARY & CONFIRMATION LOOP ----------
-elif st.session_state.stage == "summary":
+elif booking.stage == SUMMARY:
     st.subheader("📋 Booking Summary")
 
-    summary_task = get_task_by_description(st.session_state.crew, "travel summary agent")
-    if not summary_task:
-        st.error("No summary task found. Check task config.")
-    else:
+    # Generated once per visit to this stage; button reruns reuse it
+    if booking.summary is None:
         with st.spinner("Generating booking summary..."):
-            context = run_tool(st.session_state.tools, "get_context", {})
-            context_str = str(context)
-            summary_result = Crew(
-                agents=[summary_task.agent],
-                tasks=[Task(
-                    description=(
-                        f"Here is the booking context:\n\n{context_str}\n\n"
-                        "Summarize the full booking in JSON, including selected flight details, and ask for confirmation."
-                    ),
-                    expected_output="Full human readable clean summary including selected flight details + prompt to confirm or edit.",
-                    agent=summary_task.agent,
-                    tools=st.session_state.tools,
-                )]
-            ).kickoff()
-
-        st.session_state.chat_history.append(("assistant", f"Booking Summary:\n{summary_result.raw}"))
-        st.markdown("**Booking Summary:**\n\n" + str(summary_result.raw))
-
-        # User confirmation choice
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            if st.button("✅ Confirm Booking", type="primary"):
-                st.success("✅ Booking confirmed. Travel request is sent for approval.")
-                st.session_state.chat_history.append(("user", "Confirmed booking"))
-                st.session_state.chat_history.append(("assistant", "Booking confirmed. Travel request is sent for approval."))
+            summary = run_streaming(engine.summarize, booking)
+        st.session_state.chat_history.append(("assistant", f"Booking Summary:\n{summary}"))
+
+    st.markdown("**Booking Summary:**\n\n" + str(booking.summary))
+
+    # User confirmation choice
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        if st.button("✅ Confirm Booking", type="primary"):
+            message = asyncio.run(engine.confirm(booking))
+            st.session_state.chat_history.append(("user", "Confirmed booking"))
+            st.session_state.chat_history.append(("assistant", message))
+            if booking.stage != DONE:
+                st.error(message)
+            else:
+                st.success(f"✅ {message}")
                 st.balloons()
                 st.stop()
-        
-        with col2:
-            if st.button("✏️ Edit Booking"):
-                st.info("What would you like to edit?")
-                st.session_state.chat_history.append(("user", "I want to edit"))
-                st.session_state.chat_history.append(("assistant", "What would you like to edit?"))
-                # Reset to questions stage for editing
-                st.session_state.stage = "questions"
-                st.session_state.last_question = ""
-                st.rerun()
+    
+    with col2:
+        if st.button("✏️ Edit Booking"):
+            # Ask which field to change; options and summary are kept until then
+            turn = asyncio.run(engine.edit(booking))
+            st.session_state.chat_history.append(("user", "I want to edit"))
+            st.session_state.chat_history.append(("assistant", turn.message))
+            st.rerun()
+
+# ---------- TARGETED EDIT ----------
+elif booking.stage == EDIT:
+    user_input = st.chat_input("Your correction:")
+    if user_input:
+        st.session_state.chat_history.append(("user", user_input))
+        with st.spinner("Applying your correction..."):
+            turn = run_streaming(engine.apply_edit, booking, user_input)
+        for field, error in turn.errors.items():
+            say("assistant", f"{field}: {error}")
+        if booking.stage == EDIT:
+            say("assistant", booking.last_question)
+        else:
+            st.session_state.chat_history.append(("assistant", turn.message))
+            st.rerun()
 
 # ---------- SIDEBAR WITH SESSION INFO ----------
 with st.sidebar:
     st.header("Session Info")
-    # st.write(f"**Current Stage:** {st.session_state.stage.title()}")
-    # st.write(f"**Pending Fields:** {len(st.session_state.pending_fields)}")
+    # st.write(f"**Current Stage:** {booking.stage.title()}")
+    # st.write(f"**Pending Fields:** {len(booking.pending)}")
+    st.caption(f"Fast-path hit rate: {engine.fast_path.stats()['hit_rate']:.0%}")
+    if engine.llm_cache is not None:
+        st.caption(f"LLM cache hit rate: {engine.llm_cache.stats()['hit_rate']:.0%}")
+
+    if st.button("📈 Show Metrics"):
+        st.json({
+            "client": metrics.dump(),
+            "server": decode_result(engine.tools.call("get_metrics")),
+        })
     
     if st.button("🔄 Reset Session"):
+        engine.tools.call("reset_state", {"session_id": booking.session_id})
         for key in list(st.session_state.keys()):
             del st.session_state[key]
+        st.query_params.clear()
         st.rerun()
     
     if st.button("💾 Show Context"):
-        if st.session_state.tools:
-            context = run_tool(st.session_state.tools, "get_context", {})
-            st.json(context)
+        # Only fields changed since the last view are fetched
+        if "context_mirror" not in st.session_state:
+            st.session_state.context_mirror = ContextMirror(engine.tools, booking.session_id)
+        st.json(st.session_state.context_mirror.refresh().filled())
 
 # ---------- FOOTER ----------
 st.markdown("---")
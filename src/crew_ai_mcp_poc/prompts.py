@@ -0,0 +1,159 @@
+"""Token-budgeted inputs for the crew's task templates.
+
+Each prompt is counted as the agent's own text and tool schemas plus the
+rendered task description. Optional inputs are dropped, in the order
+given, until the prompt fits the budget. If it still does not fit, a
+ValueError is raised and the LLM is not called.
+"""
+from dataclasses import dataclass, field
+from functools import lru_cache
+import json
+import os
+
+from crew_ai_mcp_poc.crew import get_agent_by_task, load_config, role_tools
+
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "1200"))
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+# Direct, tool-free completion for structured extraction. Not a tasks.yaml
+# entry, so it stays out of the full crew used by train/test.
+STRUCTURED_EXTRACTION_TASK = "extract_fields_json"
+STRUCTURED_EXTRACTION_TEMPLATE = """User input: "{user_input}"
+
+The user was asked for {field}.
+Reply with only a JSON object that follows this JSON schema. Use dotted field paths as keys, \
+dates as dd/mm/yyyy, and leave out every field the input does not clearly give. \
+A flight means travelPlan.travelMode "air".
+{schema}"""
+
+# The edit handler's correction prompt, in the same direct, JSON-only form
+STRUCTURED_EDIT_TASK = "edit_fields_json"
+STRUCTURED_EDIT_TEMPLATE = """Booking so far (filled fields only): {context}
+
+The user wants to correct it: "{user_input}"
+Reply with only a JSON object that follows this JSON schema, holding just the fields the user \
+wants to change with their new values. Dates are dd/mm/yyyy.
+{schema}"""
+
+# Direct tasks: the agent whose role is the system message, and the template
+DIRECT_TASKS = {
+    STRUCTURED_EXTRACTION_TASK: ("extraction_agent", STRUCTURED_EXTRACTION_TEMPLATE),
+    STRUCTURED_EDIT_TASK: ("edit_handler_agent", STRUCTURED_EDIT_TEMPLATE),
+}
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        # Optional dependency; without it tokens are estimated from length
+        import tiktoken
+    except ImportError:
+        return None
+    return tiktoken.get_encoding(TOKENIZER_ENCODING)
+
+
+def count_tokens(text):
+    encoder = _encoder()
+    if encoder is None:
+        return (len(text) + 3) // 4
+    return len(encoder.encode(text))
+
+
+def tool_tokens(tool):
+    """Tokens a tool's name, description and argument schema add to a prompt."""
+    schema = getattr(tool, "args_schema", None)
+    spec = schema.model_json_schema() if hasattr(schema, "model_json_schema") else {}
+    return count_tokens(f"{tool.name}\n{getattr(tool, 'description', '')}\n{json.dumps(spec)}")
+
+
+def agent_text(cfg):
+    return " ".join(str(cfg.get(k, "")).strip() for k in ("role", "goal", "backstory"))
+
+
+@dataclass
+class PromptReport:
+    task: str
+    tokens: int
+    budget: int
+    dropped: list = field(default_factory=list)
+
+
+class PromptBuilder:
+    """Renders task inputs within a token budget and reports the prompt size."""
+
+    def __init__(self, tools, budget=PROMPT_TOKEN_BUDGET):
+        agents_config, tasks_config = load_config()
+        self.budget = budget
+        self.templates = {key: task["description"] for key, task in tasks_config.items()}
+        self.overhead = {}
+        for key in tasks_config:
+            agent = agents_config[get_agent_by_task(key)]
+            self.overhead[key] = count_tokens(agent_text(agent)) + sum(tool_tokens(t) for t in role_tools(tools, agent))
+        # Direct tasks send no tool schemas; the agent text is the system message
+        self.system = {}
+        for key, (agent_name, template) in DIRECT_TASKS.items():
+            self.templates[key] = template
+            self.system[key] = agent_text(agents_config[agent_name])
+            self.overhead[key] = count_tokens(self.system[key])
+
+    def build(self, task_key, inputs, optional=()):
+        inputs = dict(inputs)
+        dropped = []
+        tokens = self._measure(task_key, inputs)
+        for name in optional:
+            if tokens <= self.budget:
+                break
+            inputs[name] = ""
+            dropped.append(name)
+            tokens = self._measure(task_key, inputs)
+        if tokens > self.budget:
+            raise ValueError(f"Prompt for '{task_key}' needs {tokens} tokens, over the budget of {self.budget}")
+        return inputs, PromptReport(task_key, tokens, self.budget, dropped)
+
+    def _measure(self, task_key, inputs):
+        return self.overhead[task_key] + count_tokens(self.templates[task_key].format(**inputs))
+
+    def extraction(self, user_input, session_id, field, options, pending):
+        """Inputs for extract_fields_node: the asked field, its options, other pending names."""
+        others = [f for f in pending if f != field]
+        return self.build(
+            "extract_fields_node",
+            {
+                "user_input": user_input.strip(),
+                "session_id": session_id,
+                "field": field or "any booking field",
+                "options": f" (one of: {', '.join(options)})" if options else "",
+                "other_fields": f"Other fields still missing: {', '.join(others)}." if others else "",
+            },
+            optional=("other_fields",),
+        )
+
+    def summary(self, filled_context):
+        """Inputs for confirm_summary_node: the filled fields as compact JSON."""
+        context = json.dumps(filled_context, separators=(",", ":"), ensure_ascii=False)
+        return self.build("confirm_summary_node", {"context": context})
+
+    def messages(self, task_key, inputs):
+        """Chat messages for a direct task, within the budget."""
+        inputs, report = self.build(task_key, inputs)
+        messages = [
+            {"role": "system", "content": self.system[task_key]},
+            {"role": "user", "content": self.templates[task_key].format(**inputs)},
+        ]
+        return messages, report
+
+    def structured_extraction(self, user_input, field, schema):
+        """Messages asking the extraction model for one JSON object matching ``schema``."""
+        return self.messages(STRUCTURED_EXTRACTION_TASK, {
+            "user_input": user_input.strip(),
+            "field": field or "any booking field",
+            "schema": json.dumps(schema, separators=(",", ":")),
+        })
+
+    def structured_edit(self, user_input, filled_context, schema):
+        """Messages asking the edit handler for the fields a correction changes."""
+        return self.messages(STRUCTURED_EDIT_TASK, {
+            "user_input": user_input.strip(),
+            "context": json.dumps(filled_context, separators=(",", ":"), ensure_ascii=False),
+            "schema": json.dumps(schema, separators=(",", ":")),
+        })
@@ -0,0 +1,140 @@
+"""Per-agent model routing and the call policy that bounds turn latency.
+
+Each agent in agents.yaml may name a ``model``: a tier (``fast`` or
+``large``, set by MODEL_FAST and MODEL_LARGE) or a model name. It may also
+set its own ``timeout`` per attempt, overall ``deadline``, ``retries``,
+``max_iter`` and ``hedge_after``. Calls run on worker threads: an attempt
+that is still running after ``hedge_after`` seconds gets a second,
+identical request, and the first answer wins. Failed or timed-out attempts
+are retried with exponential backoff until the deadline. Latency per model
+is recorded under ``llm.<model>`` in the metrics registry.
+"""
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import contextvars
+from dataclasses import dataclass
+import os
+import random
+import time
+from typing import Optional
+
+from crew_ai_mcp_poc.telemetry import metrics
+
+MODEL_TIERS = {
+    "fast": os.getenv("MODEL_FAST"),
+    "large": os.getenv("MODEL_LARGE"),
+}
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "60"))
+LLM_RETRIES = int(os.getenv("LLM_RETRIES", "2"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))
+AGENT_MAX_ITER = int(os.getenv("AGENT_MAX_ITER", "5"))
+# Hedging doubles the requests of slow calls; off unless enabled
+LLM_HEDGING = os.getenv("LLM_HEDGING", "false").lower() == "true"
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", "16"))
+
+# Abandoned attempts cannot be interrupted; they finish here in the background
+_llm_pool = ThreadPoolExecutor(max_workers=LLM_WORKERS, thread_name_prefix="llm")
+
+
+def resolve_model(cfg):
+    """The model an agent config routes to, or "" for crewAI's default."""
+    name = cfg.get("model") or cfg.get("llm")
+    if name in MODEL_TIERS:
+        name = MODEL_TIERS[name]
+    return name or os.getenv("MODEL") or os.getenv("OPENAI_MODEL_NAME") or ""
+
+
+@dataclass(frozen=True)
+class CallPolicy:
+    model: str
+    timeout: float = LLM_TIMEOUT
+    deadline: float = LLM_DEADLINE
+    retries: int = LLM_RETRIES
+    backoff: float = LLM_BACKOFF
+    max_iter: int = AGENT_MAX_ITER
+    hedge_after: Optional[float] = None
+
+    @classmethod
+    def from_config(cls, cfg):
+        hedge_after = cfg.get("hedge_after")
+        return cls(
+            model=resolve_model(cfg),
+            timeout=float(cfg.get("timeout", LLM_TIMEOUT)),
+            deadline=float(cfg.get("deadline", LLM_DEADLINE)),
+            retries=int(cfg.get("retries", LLM_RETRIES)),
+            backoff=float(cfg.get("backoff", LLM_BACKOFF)),
+            max_iter=int(cfg.get("max_iter", AGENT_MAX_ITER)),
+            hedge_after=float(hedge_after) if hedge_after is not None and LLM_HEDGING else None,
+        )
+
+    @property
+    def label(self):
+        return self.model or "default"
+
+
+def call_with_policy(fn, policy, hedge=True):
+    """Run blocking ``fn`` under ``policy``; raise its last error or TimeoutError.
+
+    Pass ``hedge=False`` when a duplicate call would have side effects.
+    """
+    deadline = time.monotonic() + policy.deadline
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return _attempt(fn, policy, deadline, hedge and policy.hedge_after is not None)
+        except Exception as e:
+            error = e
+        remaining = deadline - time.monotonic()
+        if attempt > policy.retries or remaining <= 0:
+            metrics.incr(f"llm.{policy.label}.failed")
+            raise error
+        metrics.incr(f"llm.{policy.label}.retries")
+        # Full jitter keeps retries of concurrent turns from lining up
+        time.sleep(min(remaining, random.uniform(0, policy.backoff * 2 ** (attempt - 1))))
+
+
+def _attempt(fn, policy, deadline, hedge):
+    timeout = min(policy.timeout, deadline - time.monotonic())
+    ends = time.monotonic() + timeout
+    # The first request keeps the caller's context (trace, token sink); a
+    # hedge runs without it so its tokens are not streamed twice
+    futures = [_llm_pool.submit(contextvars.copy_context().run, _timed, fn, policy)]
+    if hedge and policy.hedge_after < timeout:
+        done, _ = wait(futures, timeout=policy.hedge_after)
+        if not done:
+            metrics.incr(f"llm.{policy.label}.hedges")
+            futures.append(_llm_pool.submit(_timed, fn, policy))
+
+    pending = set(futures)
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, ends - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                if len(futures) > 1 and future is futures[1]:
+                    metrics.incr(f"llm.{policy.label}.hedge_wins")
+                return future.result()
+            error = future.exception()
+    if error is not None and not pending:
+        raise error
+    # Attempts still queued behind busy workers never start; only those
+    # already running can outlive the deadline
+    for future in pending:
+        future.cancel()
+    metrics.incr(f"llm.{policy.label}.timeouts")
+    raise TimeoutError(f"No answer from model '{policy.label}' within {timeout:.1f}s")
+
+
+def _timed(fn, policy):
+    started = time.perf_counter()
+    try:
+        return fn()
+    except Exception:
+        metrics.incr(f"llm.{policy.label}.errors")
+        raise
+    finally:
+        metrics.incr(f"llm.{policy.label}.calls")
+        metrics.observe(f"llm.{policy.label}", (time.perf_counter() - started) * 1000)
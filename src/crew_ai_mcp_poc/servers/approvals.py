@@ -0,0 +1,282 @@
+"""Durable outbound queue of confirmed bookings for the approvals system.
+
+``confirm_booking`` only writes the booking to a SQLite outbox and returns;
+a background worker sends pending rows to the sink in batches. Every row
+carries an idempotency key derived from the session and its context, so a
+repeated confirmation is not queued twice and the sink can discard
+redelivered items. A batch is claimed before it is sent: its rows move to
+``sending`` under a lease, so another flusher on the same file skips them,
+and rows whose sender died are picked up again once the lease runs out.
+A failed batch is retried with exponential backoff; rows
+that still fail after APPROVAL_MAX_ATTEMPTS are moved to the dead letters.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import urllib.request
+
+from crew_ai_mcp_poc.telemetry import metrics
+
+APPROVAL_QUEUE_PATH = os.getenv("APPROVAL_QUEUE_PATH", ".approval_queue.db")
+# "file:<path>" appends batches as JSONL (a stand-in approvals system);
+# an http(s) URL receives each batch as one JSON POST; "null" drops them
+APPROVAL_SINK = os.getenv("APPROVAL_SINK", "file:.approvals.jsonl")
+APPROVAL_BATCH_SIZE = int(os.getenv("APPROVAL_BATCH_SIZE", "50"))
+APPROVAL_FLUSH_INTERVAL = float(os.getenv("APPROVAL_FLUSH_INTERVAL", "1.0"))
+APPROVAL_MAX_ATTEMPTS = int(os.getenv("APPROVAL_MAX_ATTEMPTS", "5"))
+APPROVAL_BACKOFF = float(os.getenv("APPROVAL_BACKOFF", "2.0"))
+APPROVAL_HTTP_TIMEOUT = float(os.getenv("APPROVAL_HTTP_TIMEOUT", "10"))
+# How long a claimed batch may take to send before other flushers reclaim it
+APPROVAL_LEASE = float(os.getenv("APPROVAL_LEASE", "60"))
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+
+def idempotency_key(session_id, booking):
+    raw = session_id + "\0" + json.dumps(booking, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class NullSink:
+    """Accepts and drops every batch; for benchmarks and offline runs."""
+
+    def send(self, items):
+        pass
+
+
+class FileSink:
+    """Appends each batch to a JSONL file, one approval request per line."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def send(self, items):
+        with open(self.path, "a", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+class HttpSink:
+    """POSTs each batch as ``{"requests": [...]}``; any non-2xx answer fails the batch."""
+
+    def __init__(self, url, timeout=APPROVAL_HTTP_TIMEOUT):
+        self.url = url
+        self.timeout = timeout
+
+    def send(self, items):
+        body = json.dumps({"requests": items}).encode("utf-8")
+        batch_key = hashlib.sha256("".join(i["idempotencyKey"] for i in items).encode()).hexdigest()[:32]
+        request = urllib.request.Request(
+            self.url, data=body, method="POST",
+            headers={"Content-Type": "application/json", "Idempotency-Key": batch_key},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            if not 200 <= response.status < 300:
+                raise RuntimeError(f"Approvals endpoint answered {response.status}")
+
+
+def open_sink(target=APPROVAL_SINK):
+    if target.startswith(("http://", "https://")):
+        return HttpSink(target)
+    if target.startswith("file:"):
+        return FileSink(target[len("file:"):])
+    if target == "null":
+        return NullSink()
+    raise ValueError(f"Unknown APPROVAL_SINK '{target}'; use file:<path>, an http(s) URL or null")
+
+
+class ApprovalQueue:
+    """SQLite outbox (WAL mode) drained by one background flush thread.
+
+    The thread starts with the first enqueue, or at once if an earlier
+    process left rows pending, and wakes early whenever a row is added.
+    """
+
+    def __init__(self, path, sink, batch_size=APPROVAL_BATCH_SIZE, flush_interval=APPROVAL_FLUSH_INTERVAL,
+                 max_attempts=APPROVAL_MAX_ATTEMPTS, backoff=APPROVAL_BACKOFF, lease=APPROVAL_LEASE):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS outbox (
+                key TEXT PRIMARY KEY,
+                session_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                -- when a pending row is due, or a sending row's lease expires
+                next_attempt REAL NOT NULL,
+                created REAL NOT NULL,
+                sent_at REAL,
+                error TEXT
+            );
+            CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt);
+        """)
+        if self.stats()["depth"]:
+            self._start()
+
+    def enqueue(self, session_id, booking):
+        """Queue a booking; returns its key, status and whether this call added it."""
+        key = idempotency_key(session_id, booking)
+        now = time.time()
+        with self._lock:
+            added = self._conn.execute(
+                "INSERT OR IGNORE INTO outbox (key, session_id, payload, status, next_attempt, created)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, session_id, json.dumps(booking), PENDING, now, now),
+            ).rowcount == 1
+            status = self._conn.execute("SELECT status FROM outbox WHERE key = ?", (key,)).fetchone()[0]
+        metrics.incr("approvals.enqueued" if added else "approvals.duplicates")
+        self._start()
+        self._wake.set()
+        return {"idempotencyKey": key, "status": status, "queued": added}
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None and not self._stop.is_set():
+                self._thread = threading.Thread(target=self._run, name="approval-flush", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # Drain everything that is due before sleeping again
+            while not self._stop.is_set() and self.flush_once():
+                pass
+
+    def flush_once(self):
+        """Send one batch of due rows; returns how many were sent."""
+        rows = self._claim()
+        if not rows:
+            return 0
+
+        items = [
+            {"idempotencyKey": key, "sessionId": session_id, "booking": json.loads(payload)}
+            for key, session_id, payload, _ in rows
+        ]
+        started = time.perf_counter()
+        try:
+            self.sink.send(items)
+        except Exception as e:
+            metrics.incr("approvals.flush_errors")
+            self._fail(rows, f"{type(e).__name__}: {e}")
+            return 0
+        finally:
+            metrics.observe("approvals.flush", (time.perf_counter() - started) * 1000)
+
+        sent_at = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, sent_at = ?, attempts = attempts + 1, error = NULL WHERE key = ?",
+                [(SENT, sent_at, key) for key, *_ in rows],
+            )
+            self._conn.execute("COMMIT")
+        metrics.incr("approvals.sent", len(rows))
+        return len(rows)
+
+    def _claim(self):
+        # Select and lease in one write transaction, so no other flusher on
+        # the file can claim the same rows in between
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "SELECT key, session_id, payload, attempts FROM outbox"
+                    " WHERE status IN (?, ?) AND next_attempt <= ? ORDER BY created LIMIT ?",
+                    (PENDING, SENDING, now, self.batch_size),
+                ).fetchall()
+                self._conn.executemany(
+                    "UPDATE outbox SET status = ?, next_attempt = ? WHERE key = ?",
+                    [(SENDING, now + self.lease, key) for key, *_ in rows],
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def _fail(self, rows, error):
+        now = time.time()
+        updates, dead = [], 0
+        for key, _, _, attempts in rows:
+            attempts += 1
+            if attempts >= self.max_attempts:
+                updates.append((DEAD, attempts, now, error, key))
+                dead += 1
+            else:
+                updates.append((PENDING, attempts, now + self.backoff * 2 ** (attempts - 1), error, key))
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt = ?, error = ? WHERE key = ?", updates
+            )
+            self._conn.execute("COMMIT")
+        metrics.incr("approvals.retries", len(rows) - dead)
+        if dead:
+            metrics.incr("approvals.dead_lettered", dead)
+
+    def retry_dead(self):
+        """Move dead letters back to pending, e.g. after the approvals system is fixed."""
+        with self._lock:
+            moved = self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = 0, next_attempt = ? WHERE status = ?",
+                (PENDING, time.time(), DEAD),
+            ).rowcount
+        if moved:
+            self._start()
+            self._wake.set()
+        return moved
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            retrying, oldest = self._conn.execute(
+                "SELECT COUNT(CASE WHEN attempts > 0 THEN 1 END), MIN(created) FROM outbox WHERE status IN (?, ?)",
+                (PENDING, SENDING),
+            ).fetchone()
+        return {
+            "depth": counts.get(PENDING, 0) + counts.get(SENDING, 0),
+            "sending": counts.get(SENDING, 0),
+            "retrying": retrying,
+            "sent": counts.get(SENT, 0),
+            "dead": counts.get(DEAD, 0),
+            "oldest_pending_seconds": now - oldest if oldest is not None else 0.0,
+            "flush": metrics.dump()["latency"].get("approvals.flush"),
+        }
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + APPROVAL_HTTP_TIMEOUT)
+            if self._thread.is_alive():
+                # A send is still in flight and will write its outcome; the
+                # process exit closes the file, and the lease covers a lost result
+                return
+        with self._lock:
+            self._conn.close()
+
+
+def open_queue(path=APPROVAL_QUEUE_PATH, sink=None):
+    """The outbox at ``path``; an empty path keeps it in memory (lost on exit)."""
+    return ApprovalQueue(path or ":memory:", sink or open_sink())
@@ -1,203 +1,405 @@
 from mcp.server.fastmcp import FastMCP
-from datetime import datetime
+import anyio
+import argparse
+import functools
+import hashlib
+import json
+import os
+import threading
+from crew_ai_mcp_poc.servers.approvals import open_queue
+from crew_ai_mcp_poc.servers.flights import FlightIndex, parse_travel_date
+from crew_ai_mcp_poc.servers.persistence import open_store
+from crew_ai_mcp_poc.servers.schema import (
+    FIELD_ORDER, FIELD_SPECS, RECORD_SIZE, SELECTED_FLIGHT, SELECTED_FLIGHT_SLOT, SLOT_PATHS, VALID_FIELD_OPTIONS,
+    filled_context, full_context, required_mask,
+)
+from crew_ai_mcp_poc.servers.session_store import SessionStore
+from crew_ai_mcp_poc.telemetry import metrics, protect_stdout, traced_tool
+import atexit
+
+# Transport and worker settings; the command line overrides them
+MCP_TRANSPORT = os.getenv("MCP_TRANSPORT", "stdio")
+MCP_HOST = os.getenv("MCP_HOST", "127.0.0.1")
+MCP_PORT = int(os.getenv("MCP_PORT", "8000"))
+MCP_WORKERS = int(os.getenv("MCP_WORKERS", "8"))
 
 mcp = FastMCP("TravelContext")
+# stdout carries the MCP protocol, so console span export goes to stderr
+protect_stdout()
 
-# Global context dictionary to store state between calls
-context = {
-    "registererDetails": {
-        "projectOrOpportunity": None,
-        "billableTo": None
-    },
-    "travelPlan": {
-        "travelType": None,
-        "travelScope": None,
-        "leavingFrom": None,
-        "goingTo": None,
-        "departureDate": None,
-        # "departureTime": None,
-        # "returnDate": None,
-        # "returnTime": None,
-        "travelMode": None,
-        "companyProvidedAccommodationRequired": None,
-        "travelPurpose": None,
-        # "additionalDetails": None
-    },
-    "companyProvidedAccommodation": {
-        "accommodationCity": None,
-        "checkIn": None,
-        "checkOut": None,
-        "visitingOfficeOrLocation": None
-    },
-    "passengerDetails": {
-        "passengerName": None,
-        "relation": None
-    },
-    "approver": {
-        "approverName": None
-    },
-    "selectedFlight": None
-}
-
-required_fields = [
-    "registererDetails.projectOrOpportunity",
-    "registererDetails.billableTo",
-    "travelPlan.travelType",
-    "travelPlan.travelScope",
-    "travelPlan.leavingFrom",
-    "travelPlan.goingTo",
-    "travelPlan.departureDate",
-    # "travelPlan.departureTime",
-    # "travelPlan.returnDate",
-    # "travelPlan.returnTime",
-    "travelPlan.travelMode",
-    "travelPlan.companyProvidedAccommodationRequired",
-    "travelPlan.travelPurpose",
-    # "travelPlan.additionalDetails",
-    "passengerDetails.passengerName",
-    "passengerDetails.relation",
-    "approver.approverName"
-]
-
-accommodation_fields = [
-    "companyProvidedAccommodation.accommodationCity",
-    "companyProvidedAccommodation.checkIn",
-    "companyProvidedAccommodation.checkOut",
-    "companyProvidedAccommodation.visitingOfficeOrLocation"
-]
-
-def get_nested(d, key_path):
-    try:
-        for k in key_path.split("."):
-            d = d[k]
-        return d
-    except (KeyError, TypeError):
-        return None
-
-def set_nested(d, key_path, value):
-    keys = key_path.split(".")
-    for k in keys[:-1]:
-        d = d[k]
-    d[keys[-1]] = value
-
-@mcp.tool()
-def get_filled_fields() -> list:
+_workers = None
+
+def tool(fn):
+    """Register ``fn`` as a traced MCP tool that runs on the worker thread pool.
+
+    Handlers are blocking, so the server runs them in at most MCP_WORKERS
+    threads instead of on its event loop. The module keeps the plain
+    function, which other tools and in-process callers call directly.
+    """
+    traced = traced_tool(fn)
+
+    @functools.wraps(traced)
+    async def offloaded(**kwargs):
+        global _workers
+        if _workers is None:
+            _workers = anyio.CapacityLimiter(MCP_WORKERS)
+        return await anyio.to_thread.run_sync(functools.partial(traced, **kwargs), limiter=_workers)
+
+    mcp.tool()(offloaded)
+    return traced
+
+store = open_store()
+atexit.register(store.close)
+
+def restore_session(session):
+    """Replay the durable field log of a session into a fresh context."""
+    for field, value in store.load(session.session_id).items():
+        spec = FIELD_SPECS.get(field)
+        if spec is not None:
+            set_field(session, spec, value)
+        elif field == SELECTED_FLIGHT:
+            set_selected(session, value)
+
+sessions = SessionStore(RECORD_SIZE, restore=restore_session)
+
+# The travelPlan fields a flight is searched for, and must still match when booked
+ROUTE_FIELDS = ("leavingFrom", "goingTo", "departureDate")
+ROUTE_SPECS = tuple(FIELD_SPECS[f"travelPlan.{f}"] for f in ROUTE_FIELDS)
+
+def get_field(session, spec):
+    return session.values[spec.slot]
+
+def set_field(session, spec, value):
+    """Write a field and keep the session's filled bitmask in step with it."""
+    session.values[spec.slot] = value
+    if value:
+        session.filled_mask |= spec.bit
+    else:
+        session.filled_mask &= ~spec.bit
+    mark_changed(session, spec.slot)
+
+def set_selected(session, flight_details):
+    session.values[SELECTED_FLIGHT_SLOT] = flight_details
+    mark_changed(session, SELECTED_FLIGHT_SLOT)
+
+def mark_changed(session, slot):
+    session.version += 1
+    session.slot_versions[slot] = session.version
+    session.fingerprint = None
+
+def context_fingerprint(session):
+    # Stable hash of the canonicalised context, recomputed only after a mutation
+    with session.lock:
+        if session.fingerprint is None:
+            canonical = json.dumps(
+                full_context(session.values), sort_keys=True, separators=(",", ":"), ensure_ascii=False
+            )
+            session.fingerprint = hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+        return session.fingerprint
+
+def fields_in(mask):
+    # Walk only the set bits, lowest (earliest field) first
+    fields = []
+    while mask:
+        low = mask & -mask
+        fields.append(FIELD_ORDER[low.bit_length() - 1])
+        mask ^= low
+    return fields
+
+def pending_mask(session):
+    return required_mask(session.values) & ~session.filled_mask
+
+@tool
+def get_filled_fields(session_id: str) -> list:
     """Returns a list of all fields that are already filled"""
-    filled = []
-    for f in required_fields + accommodation_fields:
-        try:
-            if get_nested(context, f):
-                filled.append(f)
-        except:
-            pass
-    return filled
-
-@mcp.tool()
-def get_pending_fields() -> list:
+    return fields_in(sessions.get(session_id).filled_mask)
+
+@tool
+def get_pending_fields(session_id: str) -> list:
     """Returns a list of missing fields, conditionally including accommodation details."""
-    pending = []
-    accommodation_required = get_nested(context, "travelPlan.companyProvidedAccommodationRequired") == "yes"
+    return fields_in(pending_mask(sessions.get(session_id)))
 
-    for f in required_fields:
-        try:
-            if not get_nested(context, f):
-                pending.append(f)
-        except:
-            pending.append(f)
-
-    if accommodation_required:
-        for f in accommodation_fields:
-            try:
-                if not get_nested(context, f):
-                    pending.append(f)
-            except:
-                pending.append(f)
-
-    return pending
-
-VALID_FIELD_OPTIONS = {
-    "registererDetails.billableTo": ["client", "company", "internal"],
-    "travelPlan.travelType": ["domestic", "international", "local"],
-    "travelPlan.travelScope": ["round trip", "multicity", "one way"],
-    "travelPlan.travelMode": ["air"],
-    "travelPlan.companyProvidedAccommodationRequired": ["yes", "no"]
-}
-
-@mcp.tool()
-def update_field(field: str, value: str) -> str:
-    """Update a field in the context after validating"""
+@tool
+def get_field_options() -> dict:
+    """Returns the allowed values for fields that take a fixed set of options"""
+    return VALID_FIELD_OPTIONS
 
-    if field not in required_fields + accommodation_fields:
+def validate_field(field, value):
+    spec = FIELD_SPECS.get(field)
+    if spec is None:
         raise ValueError(f"Invalid field name: {field}")
+    spec.validate(value)
+    return spec
 
-    # Predefined option validation
-    if field in VALID_FIELD_OPTIONS:
-        if value.lower() not in [v.lower() for v in VALID_FIELD_OPTIONS[field]]:
-            raise ValueError(
-                f"Invalid value '{value}' for field '{field}'. "
-                f"Allowed options: {', '.join(VALID_FIELD_OPTIONS[field])}"
-            )
+@tool
+def update_field(session_id: str, field: str, value: str) -> str:
+    """Update a field in the context after validating"""
+    spec = validate_field(field, value)
+    write_fields(session_id, [(spec, value)])
+    return f"{field} updated to '{value}'"
 
-    # Example validations
-    if "Date" in field:
+@tool
+def update_fields(session_id: str, updates: dict, atomic: bool = True) -> dict:
+    """Validate and apply several field updates in one call.
+
+    Returns the applied values and a per-field error map. With atomic=True
+    nothing is applied unless every field is valid.
+    """
+    valid, errors = {}, {}
+    for field, value in updates.items():
         try:
-            datetime.strptime(value, "%d/%m/%Y")
-        except ValueError:
-            raise ValueError("Invalid date format, must be dd/mm/yyyy")
+            valid[field] = (validate_field(field, value), value)
+        except ValueError as e:
+            errors[field] = str(e)
 
-    if "additionalDetails" in field and len(value.strip()) < 10:
-        raise ValueError("Additional details must be at least 10 characters")
+    if atomic and errors:
+        return {"updated": {}, "errors": errors}
 
-    set_nested(context, field, value)
-    return f"{field} updated to '{value}'"
+    write_fields(session_id, list(valid.values()))
+    return {"updated": {field: value for field, (_, value) in valid.items()}, "errors": errors}
+
+def write_fields(session_id, items):
+    """Apply and log validated ``(spec, value)`` pairs; changing the route drops the selected flight."""
+    session = sessions.get(session_id)
+    with session.lock:
+        route_changed = any(spec in ROUTE_SPECS and get_field(session, spec) != value for spec, value in items)
+        for spec, value in items:
+            set_field(session, spec, value)
+        log = [(spec.path, value) for spec, value in items]
+        if route_changed and session.values[SELECTED_FLIGHT_SLOT]:
+            set_selected(session, None)
+            log.append((SELECTED_FLIGHT, None))
+        store.record(session_id, log)
 
-@mcp.tool()
-def get_next_question() -> str:
+def route_mismatch(session, flight_details):
+    """The route fields of the session that ``flight_details`` does not fly."""
+    index = get_flight_index()
+    origin, destination, departure = (get_field(session, spec) for spec in ROUTE_SPECS)
+    try:
+        same_day = parse_travel_date(departure) == parse_travel_date(flight_details["date"])
+    except (TypeError, ValueError):
+        same_day = False
+    checks = (
+        index.airport(origin) is not None and index.airport(origin) == index.airport(flight_details["origin"]),
+        index.airport(destination) is not None
+        and index.airport(destination) == index.airport(flight_details["destination"]),
+        same_day,
+    )
+    return [field for field, ok in zip(ROUTE_FIELDS, checks) if not ok]
+
+def question_for(field):
+    q = field.split(".")[-1].replace("Id", "").replace("Or", " or ").replace("And", " and ")
+    return f"Can you please provide the {q.replace('_', ' ')}?"
+
+@tool
+def get_next_question(session_id: str) -> str:
     """Suggest the next question to ask the user"""
-    pending = get_pending_fields()
+    pending = get_pending_fields(session_id)
     if not pending:
         return "All fields are complete."
+    return question_for(pending[0])
 
-    next_field = pending[0]
-    q = next_field.split(".")[-1].replace("Id", "").replace("Or", " or ").replace("And", " and ")
-    return f"Can you please provide the {q.replace('_', ' ')}?"
+@tool
+def apply_and_advance(session_id: str, updates: dict = None) -> dict:
+    """Apply the valid updates of a turn and return everything the next turn needs.
+
+    One round-trip replaces update_field, get_pending_fields and
+    get_next_question: the response carries the per-field errors, the
+    pending list, the next field and question, a diff of changed fields and
+    the context version after the update.
+    """
+    session = sessions.get(session_id)
+    updates = updates or {}
+    # Held throughout, so the diff, pending list and version describe one state
+    with session.lock:
+        before = {field: get_field(session, FIELD_SPECS[field]) for field in updates if field in FIELD_SPECS}
+        result = update_fields(session_id, updates, atomic=False)
+        diff = {
+            field: value for field, value in result["updated"].items()
+            if before.get(field) != value
+        }
+        pending = fields_in(pending_mask(session))
+        version = session.version
+    return {
+        "updated": result["updated"],
+        "errors": result["errors"],
+        "diff": diff,
+        "pending": pending,
+        "next_field": pending[0] if pending else None,
+        "next_question": question_for(pending[0]) if pending else "All fields are complete.",
+        "version": version,
+    }
 
-@mcp.tool()
-def get_context() -> dict:
+@tool
+def get_context(session_id: str) -> dict:
     """Returns the full conversation context"""
-    return context
+    return full_context(sessions.get(session_id).values)
+
+@tool
+def get_filled_context(session_id: str) -> dict:
+    """Returns the context with only the fields that hold a value, for prompts"""
+    return filled_context(sessions.get(session_id).values)
 
-@mcp.tool()
-def reset_state() -> str:
+@tool
+def get_context_delta(session_id: str, since_version: int = 0) -> dict:
+    """Returns the fields changed after since_version, keyed by dotted path.
+
+    A null value means the field was cleared. If since_version is ahead of
+    the server (for example after a restart) every set field is returned,
+    and "since" in the response is 0.
+    """
+    session = sessions.get(session_id)
+    with session.lock:
+        if since_version > session.version:
+            since_version = 0
+        changed = {
+            SLOT_PATHS[slot]: session.values[slot]
+            for slot, version in enumerate(session.slot_versions)
+            if version > since_version
+        }
+        return {"version": session.version, "since": since_version, "changed": changed}
+
+@tool
+def get_context_fingerprint(session_id: str) -> str:
+    """Returns a hash of the context that changes whenever a field is mutated"""
+    return context_fingerprint(sessions.get(session_id))
+
+@tool
+def ping() -> str:
+    """Health check used by the client connection pool"""
+    return "pong"
+
+@tool
+def get_session_stats() -> dict:
+    """Returns session store occupancy and eviction counters"""
+    return sessions.stats()
+
+@tool
+def get_metrics() -> dict:
+    """Returns the server's counters and per-tool latency histograms"""
+    return metrics.dump()
+
+@tool
+def reset_state(session_id: str) -> str:
     """Clears the context for new session"""
-    for f in required_fields + accommodation_fields:
-        set_nested(context, f, None)
-    set_nested(context, "selectedFlight", None)
+    sessions.drop(session_id)
+    store.drop(session_id)
     return "Context state has been reset."
 
-FLIGHT_OPTIONS = {
-    "1": "Air Indigo, 08:00 AM, ₹5500, Economy",
-    "2": "Vistara, 11:30 AM, ₹6200, Economy",
-    "3": "Air India, 6:45 PM, ₹5900, Premium Economy"
-}
-
-@mcp.tool()
-def set_selected_flight(option: str) -> str:
-    """Set the selected flight option"""
-    if option not in FLIGHT_OPTIONS:
-        raise ValueError("Invalid flight option. Choose 1, 2, or 3.")
-    
-    # Parse the flight details into a structured format
-    flight_info = FLIGHT_OPTIONS[option].split(", ")
-    flight_details = {
-        "airline": flight_info[0],
-        "departureTime": flight_info[1],
-        "price": flight_info[2],
-        "class": flight_info[3]
-    }
-    
-    set_nested(context, "selectedFlight", flight_details)
-    return f"Flight option {option} selected: {FLIGHT_OPTIONS[option]}"
+_flight_index = None
+_flight_index_lock = threading.Lock()
+
+def get_flight_index():
+    # serve() loads it before taking requests; in-process callers on first use
+    global _flight_index
+    with _flight_index_lock:
+        if _flight_index is None:
+            _flight_index = FlightIndex.load()
+        return _flight_index
+
+@tool
+def search_flights(session_id: str, page: int = 1, page_size: int = 3, sort: str = "price",
+                   cabin: str = "", max_price: int = 0) -> dict:
+    """Search flights for the session's route and departure date.
+
+    Uses the filled travelPlan fields; sort is 'price' or 'departure'.
+    Returns one page of results, each with a stable flightId.
+    """
+    session = sessions.get(session_id)
+    origin, destination, departure = (get_field(session, spec) for spec in ROUTE_SPECS)
+    missing = [f for f, v in zip(ROUTE_FIELDS, (origin, destination, departure)) if not v]
+    if missing:
+        raise ValueError(f"Cannot search flights, missing travelPlan fields: {', '.join(missing)}")
+
+    return get_flight_index().search(
+        origin,
+        destination,
+        parse_travel_date(departure),
+        cabin=cabin or None,
+        max_price=max_price or None,
+        sort=sort,
+        page=page,
+        page_size=page_size,
+    )
+
+@tool
+def set_selected_flight(session_id: str, flight_id: str) -> str:
+    """Set the selected flight by the flightId returned from search_flights for this session's route"""
+    flight_details = get_flight_index().get(flight_id)
+    if flight_details is None:
+        raise ValueError(f"Unknown flight id '{flight_id}'. Use an id returned by search_flights.")
+    session = sessions.get(session_id)
+    with session.lock:
+        mismatch = route_mismatch(session, flight_details)
+        if mismatch:
+            raise ValueError(
+                f"Flight {flight_id} does not match travelPlan {', '.join(mismatch)}. "
+                "Use an id returned by search_flights for this session."
+            )
+        set_selected(session, flight_details)
+        store.record(session_id, [(SELECTED_FLIGHT, flight_details)])
+    return (
+        f"Flight {flight_details['flightId']} selected: {flight_details['airline']}, "
+        f"{flight_details['departureTime']}, {flight_details['price']}, {flight_details['class']}"
+    )
+
+_approval_queue = None
+_approval_queue_lock = threading.Lock()
+
+def get_approval_queue():
+    # Opened on first confirmation, or by serve() to resume an unsent backlog
+    global _approval_queue
+    with _approval_queue_lock:
+        if _approval_queue is None:
+            _approval_queue = open_queue()
+            atexit.register(_approval_queue.close)
+        return _approval_queue
+
+@tool
+def confirm_booking(session_id: str) -> dict:
+    """Queue the completed booking for approval and return at once with its idempotency key"""
+    session = sessions.get(session_id)
+    # Checked and copied as one state; queued after the lock is released
+    with session.lock:
+        pending = fields_in(pending_mask(session))
+        if pending:
+            raise ValueError(f"The booking is incomplete; pending fields: {', '.join(pending)}")
+        flight_details = session.values[SELECTED_FLIGHT_SLOT]
+        if not flight_details:
+            raise ValueError("Select a flight with set_selected_flight before confirming.")
+        mismatch = route_mismatch(session, flight_details)
+        if mismatch:
+            raise ValueError(
+                f"The selected flight {flight_details['flightId']} does not match travelPlan "
+                f"{', '.join(mismatch)}; search and select a flight again."
+            )
+        booking = full_context(session.values)
+    queue = get_approval_queue()
+    receipt = queue.enqueue(session_id, booking)
+    receipt["depth"] = queue.stats()["depth"]
+    return receipt
+
+@tool
+def get_approval_queue_stats() -> dict:
+    """Returns the approval queue depth, retrying, sent and dead-letter counts and flush latency"""
+    return get_approval_queue().stats()
+
+def serve(argv=None):
+    """Console entry point: `context_server [--transport stdio|sse|streamable-http] ...`."""
+    global MCP_WORKERS
+    parser = argparse.ArgumentParser(description="Travel booking context MCP server")
+    parser.add_argument("--transport", choices=["stdio", "sse", "streamable-http"], default=MCP_TRANSPORT)
+    parser.add_argument("--host", default=MCP_HOST)
+    parser.add_argument("--port", type=int, default=MCP_PORT)
+    parser.add_argument("--workers", type=int, default=MCP_WORKERS, help="concurrent tool handler threads")
+    args = parser.parse_args(argv)
+
+    MCP_WORKERS = args.workers
+    mcp.settings.host = args.host
+    mcp.settings.port = args.port
+    get_flight_index()
+    get_approval_queue()
+    mcp.run(transport=args.transport)
 
 if __name__ == "__main__":
-    mcp.run(transport="stdio")
+    serve()
@@ -0,0 +1,150 @@
+from datetime import date, datetime
+import csv
+import heapq
+import os
+
+DEFAULT_DATA_PATH = os.path.join(os.path.dirname(__file__), "data", "flights.csv")
+FLIGHT_DATA_PATH = os.getenv("FLIGHT_DATA_PATH", DEFAULT_DATA_PATH)
+
+
+def parse_travel_date(value):
+    return datetime.strptime(value, "%d/%m/%Y").date()
+
+
+class FlightIndex:
+    """In-memory flight index, stored column-wise and keyed by (origin, destination, date).
+
+    Routes are indexed once, by airport code; city names and codes resolve
+    to the code through one lower-cased alias map. Each column is a list
+    and a flight is a row number into them. Daily flights are stored under
+    a ``None`` date and merged into every date-specific lookup. Each bucket
+    is kept sorted by price.
+    """
+
+    COLUMNS = ("flight_id", "origin", "destination", "date", "departure_time", "airline", "cabin", "price")
+
+    def __init__(self):
+        for column in self.COLUMNS:
+            setattr(self, column, [])
+        self.names = {}
+        self.aliases = {}
+        self._routes = {}
+        self._by_id = {}
+
+    @property
+    def size(self):
+        return len(self.flight_id)
+
+    @property
+    def cities(self):
+        return set(self.names.values())
+
+    def airport(self, name):
+        """The airport code a city name or code refers to, or None."""
+        return self.aliases.get(name.strip().lower()) if name else None
+
+    def add(self, row):
+        origin, destination = row["origin_code"].upper(), row["destination_code"].upper()
+        for code, city in ((origin, row["origin"]), (destination, row["destination"])):
+            self.names.setdefault(code, city)
+            self.aliases.setdefault(code.lower(), code)
+            self.aliases.setdefault(city.lower(), code)
+
+        i = self.size
+        values = (
+            row["flight_id"], origin, destination, _row_date(row.get("date")),
+            row["departure_time"], row["airline"], row["cabin"], int(row["price"]),
+        )
+        for column, value in zip(self.COLUMNS, values):
+            getattr(self, column).append(value)
+        self._routes.setdefault((origin, destination, values[3]), []).append(i)
+        self._by_id[values[0]] = i
+
+    def finalise(self):
+        sort_key = self._sort_key("price")
+        for bucket in self._routes.values():
+            bucket.sort(key=sort_key)
+
+    @classmethod
+    def load(cls, path=FLIGHT_DATA_PATH):
+        index = cls()
+        for row in _read_rows(path):
+            index.add(row)
+        index.finalise()
+        return index
+
+    def _sort_key(self, sort):
+        price, departure = self.price, self.departure_time
+        if sort == "departure":
+            return lambda i: (departure[i], price[i])
+        return lambda i: (price[i], departure[i])
+
+    def search(self, origin, destination, travel_date, cabin=None, max_price=None,
+               sort="price", page=1, page_size=3):
+        o, d = self.airport(origin), self.airport(destination)
+        dated = self._routes.get((o, d, travel_date), [])
+        daily = self._routes.get((o, d, None), [])
+        if sort == "price":
+            # Buckets are pre-sorted by price, so a merge keeps the order
+            candidates = list(heapq.merge(dated, daily, key=self._sort_key("price")))
+        else:
+            candidates = sorted(dated + daily, key=self._sort_key(sort))
+        if cabin:
+            candidates = [i for i in candidates if self.cabin[i].lower() == cabin.lower()]
+        if max_price:
+            candidates = [i for i in candidates if self.price[i] <= max_price]
+
+        page = max(1, page)
+        start = (page - 1) * page_size
+        return {
+            "results": [self.to_dict(i, travel_date) for i in candidates[start:start + page_size]],
+            "total": len(candidates),
+            "page": page,
+            "page_size": page_size,
+        }
+
+    def to_dict(self, i, on_date=None):
+        travel_date = on_date or self.date[i]
+        return {
+            "flightId": self.flight_id[i] if self.date[i] else f"{self.flight_id[i]}-{travel_date:%Y%m%d}",
+            "airline": self.airline[i],
+            "origin": self.names[self.origin[i]],
+            "destination": self.names[self.destination[i]],
+            "date": f"{travel_date:%d/%m/%Y}",
+            "departureTime": self.departure_time[i],
+            "price": f"₹{self.price[i]}",
+            "class": self.cabin[i],
+        }
+
+    def get(self, flight_id):
+        """Resolve a flight id from search results; daily ids carry a -YYYYMMDD suffix."""
+        i = self._by_id.get(flight_id)
+        if i is not None:
+            return self.to_dict(i) if self.date[i] else None
+        base, _, day = flight_id.rpartition("-")
+        i = self._by_id.get(base)
+        if i is None or self.date[i] is not None:
+            return None
+        try:
+            return self.to_dict(i, datetime.strptime(day, "%Y%m%d").date())
+        except ValueError:
+            return None
+
+
+def _row_date(value):
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(value)
+
+
+def _read_rows(path):
+    if path.endswith(".parquet"):
+        # Optional dependency, only needed for Parquet fixtures
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
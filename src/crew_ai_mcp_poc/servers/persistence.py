@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import threading
+
+STORE_PATH = os.getenv("CONTEXT_STORE_PATH", ".booking_sessions.db")
+COMPACT_EVERY = int(os.getenv("CONTEXT_STORE_COMPACT_EVERY", "1000"))
+
+
+class NullStore:
+    """Persistence disabled: sessions live only as long as the server process."""
+
+    def record(self, session_id, items):
+        pass
+
+    def load(self, session_id):
+        return {}
+
+    def drop(self, session_id):
+        pass
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class SQLiteStore:
+    """Write-ahead log of field mutations in SQLite (WAL mode).
+
+    Every mutation is appended to ``mutations``; ``compact`` folds the log
+    into one ``snapshots`` row per session. Loading a session is a snapshot
+    read plus a replay of the mutations recorded after it.
+    """
+
+    def __init__(self, path, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.compact_every = compact_every
+        self._since_compact = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS mutations (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                field TEXT NOT NULL,
+                value TEXT
+            );
+            CREATE INDEX IF NOT EXISTS mutations_session ON mutations (session_id, seq);
+            CREATE TABLE IF NOT EXISTS snapshots (
+                session_id TEXT PRIMARY KEY,
+                fields TEXT NOT NULL
+            );
+        """)
+        self.compact()
+
+    def record(self, session_id, items):
+        """Append ``(field, value)`` pairs for a session in one transaction."""
+        rows = [(session_id, field, json.dumps(value)) for field, value in items]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.executemany(
+                "INSERT INTO mutations (session_id, field, value) VALUES (?, ?, ?)", rows
+            )
+            self._conn.execute("COMMIT")
+            self._since_compact += len(rows)
+            due = self.compact_every and self._since_compact >= self.compact_every
+        if due:
+            self.compact()
+
+    def load(self, session_id):
+        """Return the latest value of every recorded field of a session."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT fields FROM snapshots WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            fields = json.loads(row[0]) if row else {}
+            for field, value in self._conn.execute(
+                "SELECT field, value FROM mutations WHERE session_id = ? ORDER BY seq", (session_id,)
+            ):
+                fields[field] = json.loads(value)
+        return fields
+
+    def drop(self, session_id):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            self._conn.execute("DELETE FROM mutations WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM snapshots WHERE session_id = ?", (session_id,))
+            self._conn.execute("COMMIT")
+
+    def compact(self):
+        """Fold logged mutations into per-session snapshots and truncate the log."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            max_seq = self._conn.execute("SELECT MAX(seq) FROM mutations").fetchone()[0]
+            if max_seq is None:
+                self._conn.execute("COMMIT")
+                self._since_compact = 0
+                return
+
+            folded = {}
+            for session_id, field, value in self._conn.execute(
+                "SELECT session_id, field, value FROM mutations WHERE seq <= ? ORDER BY seq", (max_seq,)
+            ):
+                folded.setdefault(session_id, {})[field] = json.loads(value)
+
+            for session_id, changes in folded.items():
+                row = self._conn.execute(
+                    "SELECT fields FROM snapshots WHERE session_id = ?", (session_id,)
+                ).fetchone()
+                fields = json.loads(row[0]) if row else {}
+                fields.update(changes)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO snapshots (session_id, fields) VALUES (?, ?)",
+                    (session_id, json.dumps(fields)),
+                )
+            self._conn.execute("DELETE FROM mutations WHERE seq <= ?", (max_seq,))
+            self._conn.execute("COMMIT")
+            self._since_compact = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def open_store(path=STORE_PATH):
+    if not path:
+        return NullStore()
+    return SQLiteStore(path)
@@ -0,0 +1,155 @@
+from datetime import datetime
+
+ACCOMMODATION_TRIGGER = "travelPlan.companyProvidedAccommodationRequired"
+
+# The booking record, section by section in context order. A section with
+# "when" is only asked for once the named field holds that value; its
+# fields are asked after every unconditional field.
+BOOKING_SCHEMA = {
+    "registererDetails": {
+        "fields": {
+            "projectOrOpportunity": {},
+            "billableTo": {"options": ["client", "company", "internal"]},
+        },
+    },
+    "travelPlan": {
+        "fields": {
+            "travelType": {"options": ["domestic", "international", "local"]},
+            "travelScope": {"options": ["round trip", "multicity", "one way"]},
+            "leavingFrom": {},
+            "goingTo": {},
+            "departureDate": {"date": True},
+            # "departureTime": {},
+            # "returnDate": {"date": True},
+            # "returnTime": {},
+            "travelMode": {"options": ["air"]},
+            "companyProvidedAccommodationRequired": {"options": ["yes", "no"]},
+            "travelPurpose": {},
+            # "additionalDetails": {"min_length": 10},
+        },
+    },
+    "companyProvidedAccommodation": {
+        "when": (ACCOMMODATION_TRIGGER, "yes"),
+        "fields": {
+            "accommodationCity": {},
+            "checkIn": {},
+            "checkOut": {},
+            "visitingOfficeOrLocation": {},
+        },
+    },
+    "passengerDetails": {
+        "fields": {
+            "passengerName": {},
+            "relation": {},
+        },
+    },
+    "approver": {
+        "fields": {
+            "approverName": {},
+        },
+    },
+}
+
+# Set from search_flights rather than asked; stored after the asked fields
+SELECTED_FLIGHT = "selectedFlight"
+
+
+class FieldSpec:
+    """A context field compiled once at startup: record slot, bit and validator."""
+
+    __slots__ = ("path", "section", "name", "slot", "bit", "options", "allowed", "is_date", "min_length")
+
+    def __init__(self, section, name, slot, rules):
+        self.path = f"{section}.{name}"
+        self.section = section
+        self.name = name
+        self.slot = slot
+        self.bit = 1 << slot
+        self.options = rules.get("options")
+        self.allowed = frozenset(o.lower() for o in self.options) if self.options else None
+        self.is_date = rules.get("date", False)
+        self.min_length = rules.get("min_length", 0)
+
+    def validate(self, value):
+        # Predefined option validation
+        if self.allowed is not None and value.lower() not in self.allowed:
+            raise ValueError(
+                f"Invalid value '{value}' for field '{self.path}'. "
+                f"Allowed options: {', '.join(self.options)}"
+            )
+
+        if self.is_date:
+            try:
+                datetime.strptime(value, "%d/%m/%Y")
+            except ValueError:
+                raise ValueError("Invalid date format, must be dd/mm/yyyy")
+
+        if self.min_length and len(value.strip()) < self.min_length:
+            raise ValueError(f"{self.name} must be at least {self.min_length} characters")
+
+
+def _compile(schema):
+    # Unconditional sections first, so slot (and bit) order is ask order
+    ordered = sorted(schema.items(), key=lambda item: "when" in item[1])
+    specs = {}
+    for section, definition in ordered:
+        for name, rules in definition["fields"].items():
+            spec = FieldSpec(section, name, len(specs), rules)
+            specs[spec.path] = spec
+    return specs
+
+
+FIELD_SPECS = _compile(BOOKING_SCHEMA)
+FIELD_ORDER = list(FIELD_SPECS)
+SELECTED_FLIGHT_SLOT = len(FIELD_ORDER)
+RECORD_SIZE = SELECTED_FLIGHT_SLOT + 1
+SLOT_PATHS = FIELD_ORDER + [SELECTED_FLIGHT]
+
+REQUIRED_MASK = sum(
+    spec.bit for spec in FIELD_SPECS.values() if "when" not in BOOKING_SCHEMA[spec.section]
+)
+# (trigger slot, trigger value, mask of the fields it adds)
+CONDITIONAL_MASKS = [
+    (
+        FIELD_SPECS[definition["when"][0]].slot,
+        definition["when"][1],
+        sum(FIELD_SPECS[f"{section}.{name}"].bit for name in definition["fields"]),
+    )
+    for section, definition in BOOKING_SCHEMA.items()
+    if "when" in definition
+]
+
+VALID_FIELD_OPTIONS = {path: spec.options for path, spec in FIELD_SPECS.items() if spec.options}
+
+# Context order of sections and their (name, slot) pairs, for projections
+LAYOUT = [
+    (section, [(name, FIELD_SPECS[f"{section}.{name}"].slot) for name in definition["fields"]])
+    for section, definition in BOOKING_SCHEMA.items()
+]
+
+
+def required_mask(values):
+    mask = REQUIRED_MASK
+    for slot, trigger, fields in CONDITIONAL_MASKS:
+        if values[slot] == trigger:
+            mask |= fields
+    return mask
+
+
+def full_context(values):
+    """The nested context with every field, unfilled ones as None."""
+    context = {section: {name: values[slot] for name, slot in fields} for section, fields in LAYOUT}
+    context[SELECTED_FLIGHT] = values[SELECTED_FLIGHT_SLOT]
+    return context
+
+
+def filled_context(values):
+    """The nested context with only the fields that hold a value."""
+    context = {}
+    for section, fields in LAYOUT:
+        filled = {name: values[slot] for name, slot in fields if values[slot]}
+        if filled:
+            context[section] = filled
+    if values[SELECTED_FLIGHT_SLOT]:
+        context[SELECTED_FLIGHT] = values[SELECTED_FLIGHT_SLOT]
+    return context
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+import os
+import threading
+import time
+
+SESSION_TTL_SECONDS = float(os.getenv("CONTEXT_SESSION_TTL", "3600"))
+MAX_SESSIONS = int(os.getenv("CONTEXT_MAX_SESSIONS", "10000"))
+
+
+class Session:
+    __slots__ = (
+        "session_id", "values", "slot_versions", "filled_mask", "version", "fingerprint", "last_access", "lock",
+    )
+
+    def __init__(self, session_id, size):
+        self.session_id = session_id
+        # Tool handlers run on worker threads; a mutation and its log entry
+        # are made under this lock so memory and the log agree on the order
+        self.lock = threading.RLock()
+        # One slot per schema field, in schema slot order
+        self.values = [None] * size
+        # Session version at which each slot last changed, for deltas
+        self.slot_versions = [0] * size
+        # Bit i is set when slot i holds a value
+        self.filled_mask = 0
+        # Bumped on every mutation; the cached fingerprint is cleared with it
+        self.version = 0
+        self.fingerprint = None
+        self.last_access = time.monotonic()
+
+
+class SessionStore:
+    """Per-session booking contexts with TTL expiry and an LRU size cap.
+
+    Sessions are created on first access as an empty record of ``size`` slots.
+    The least recently used session is evicted once ``max_sessions`` is
+    reached, and sessions idle for longer than ``ttl_seconds`` are dropped.
+    ``restore`` is called on every newly created session so durable state
+    can be replayed into it.
+    """
+
+    def __init__(self, size, ttl_seconds=SESSION_TTL_SECONDS, max_sessions=MAX_SESSIONS, restore=None):
+        self.size = size
+        self.restore = restore
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def _expired(self, session, now):
+        return self.ttl_seconds > 0 and now - session.last_access > self.ttl_seconds
+
+    def _sweep(self, now):
+        # Sessions are kept in access order, so expired ones sit at the front.
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if not self._expired(oldest, now):
+                break
+            self._sessions.popitem(last=False)
+            self.expirations += 1
+
+    def get(self, session_id):
+        if not session_id:
+            raise ValueError("session_id is required")
+        with self._lock:
+            now = time.monotonic()
+            self._sweep(now)
+            session = self._sessions.get(session_id)
+            if session is None:
+                while len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evictions += 1
+                session = Session(session_id, self.size)
+                if self.restore is not None:
+                    self.restore(session)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = now
+            return session
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,190 @@
+"""Concurrent multi-client stress driver for the context server over HTTP.
+
+Each simulated client opens its own MCP session and replays a randomised
+sequence of update_field, get_pending_fields, get_next_question and
+set_selected_flight calls against its own booking. Throughput, per-tool
+tail latency and error rates are printed as JSON.
+
+Start the server first, for example:
+
+    context_server --transport streamable-http --port 8000 --workers 16
+    stress --url http://127.0.0.1:8000/mcp --clients 200 --ops 50
+"""
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+import json
+import random
+import sys
+import time
+import uuid
+
+from mcp import ClientSession
+from mcp.client.sse import sse_client
+from mcp.client.streamable_http import streamablehttp_client
+
+from crew_ai_mcp_poc.servers.flights import FlightIndex
+from crew_ai_mcp_poc.servers.schema import FIELD_SPECS
+from crew_ai_mcp_poc.telemetry import percentile
+
+ROUTE_FIELDS = ("travelPlan.leavingFrom", "travelPlan.goingTo", "travelPlan.departureDate")
+
+# Relative frequency of each operation in a replayed sequence
+OPERATION_WEIGHTS = {
+    "update_field": 5,
+    "get_pending_fields": 3,
+    "get_next_question": 3,
+    "set_selected_flight": 1,
+}
+
+
+@asynccontextmanager
+async def open_session(transport, url):
+    if transport == "sse":
+        async with sse_client(url) as (read, write):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                yield session
+    else:
+        async with streamablehttp_client(url) as (read, write, _):
+            async with ClientSession(read, write) as session:
+                await session.initialize()
+                yield session
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.calls = 0
+
+    async def call(self, session, name, args):
+        started = time.perf_counter()
+        try:
+            result = await session.call_tool(name, args)
+            failed = result.isError
+        except Exception:
+            result, failed = None, True
+        self.latencies.setdefault(name, []).append(time.perf_counter() - started)
+        self.calls += 1
+        if failed:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return None if failed else result
+
+    def report(self, elapsed):
+        per_tool = {}
+        for name, values in sorted(self.latencies.items()):
+            per_tool[name] = {
+                "calls": len(values),
+                "errors": self.errors.get(name, 0),
+                "error_rate": self.errors.get(name, 0) / len(values),
+                "p50_ms": percentile(values, 50) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+                "max_ms": max(values) * 1000,
+            }
+        all_latencies = [v for values in self.latencies.values() for v in values]
+        errors = sum(self.errors.values())
+        return {
+            "calls": self.calls,
+            "errors": errors,
+            "error_rate": errors / self.calls if self.calls else 0.0,
+            "calls_per_second": self.calls / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(all_latencies, 50) * 1000,
+            "p99_ms": percentile(all_latencies, 99) * 1000,
+            "elapsed_seconds": elapsed,
+            "tools": per_tool,
+        }
+
+
+def random_value(rng, spec, cities):
+    if spec.options:
+        return rng.choice(spec.options)
+    if spec.is_date:
+        return f"{date.today() + timedelta(days=rng.randint(1, 90)):%d/%m/%Y}"
+    if spec.path in ROUTE_FIELDS:
+        return rng.choice(cities)
+    return f"stress value {rng.randint(1, 1000)}"
+
+
+async def run_client(transport, url, ops, rng, cities, recorder):
+    session_id = f"stress-{uuid.uuid4().hex}"
+    origin, destination = rng.sample(cities, 2)
+    route = {
+        "travelPlan.leavingFrom": origin,
+        "travelPlan.goingTo": destination,
+        "travelPlan.departureDate": random_value(rng, FIELD_SPECS["travelPlan.departureDate"], cities),
+    }
+    fields = [path for path in FIELD_SPECS if path not in ROUTE_FIELDS]
+    names, weights = zip(*OPERATION_WEIGHTS.items())
+
+    async with open_session(transport, url) as session:
+        # A filled route lets set_selected_flight pick from real search results
+        for field, value in route.items():
+            await recorder.call(session, "update_field", {"session_id": session_id, "field": field, "value": value})
+
+        for name in rng.choices(names, weights, k=ops):
+            if name == "update_field":
+                spec = FIELD_SPECS[rng.choice(fields)]
+                args = {"session_id": session_id, "field": spec.path, "value": random_value(rng, spec, cities)}
+            elif name == "set_selected_flight":
+                found = await recorder.call(session, "search_flights", {"session_id": session_id})
+                results = json.loads(found.content[0].text).get("results") if found and found.content else None
+                if not results:
+                    continue
+                args = {"session_id": session_id, "flight_id": rng.choice(results)["flightId"]}
+            else:
+                args = {"session_id": session_id}
+            await recorder.call(session, name, args)
+
+        await recorder.call(session, "reset_state", {"session_id": session_id})
+
+
+async def stress(args):
+    rng = random.Random(args.seed)
+    cities = sorted(FlightIndex.load().cities)
+    recorder = Recorder()
+    semaphore = asyncio.Semaphore(args.concurrency or args.clients)
+    failed_clients = 0
+
+    async def one(client_rng):
+        nonlocal failed_clients
+        async with semaphore:
+            try:
+                await run_client(args.transport, args.url, args.ops, client_rng, cities, recorder)
+            except Exception:
+                # Connection-level failures; tool errors are counted per call
+                failed_clients += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(random.Random(rng.random())) for _ in range(args.clients)))
+    elapsed = time.perf_counter() - started
+
+    report = recorder.report(elapsed)
+    report["clients"] = args.clients
+    report["failed_clients"] = failed_clients
+    return report
+
+
+def run():
+    parser = argparse.ArgumentParser(description="Stress the context server with concurrent MCP clients")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/mcp")
+    parser.add_argument("--transport", choices=["streamable-http", "sse"], default="streamable-http")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=0, help="clients open at once (default: all)")
+    parser.add_argument("--ops", type=int, default=50, help="randomised calls per client")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    report = {"config": vars(args), "results": asyncio.run(stress(args))}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text + "\n")
+
+
+if __name__ == "__main__":
+    run()
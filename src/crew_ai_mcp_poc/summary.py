@@ -0,0 +1,73 @@
+from collections import OrderedDict
+import json
+import os
+import threading
+
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "1024"))
+# "template" renders the summary locally; "llm" asks the summary agent for prose
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "template")
+
+# Sections the confirm_summary_node task asks for, in display order
+SUMMARY_SECTIONS = [
+    "registererDetails",
+    "travelPlan",
+    "companyProvidedAccommodation",
+    "passengerDetails",
+    "approver",
+    "selectedFlight",
+]
+
+CONFIRM_PROMPT = "Would you like to confirm this booking or edit it?"
+
+
+def render_summary(context):
+    """Render the JSON summary of confirm_summary_node without an LLM call."""
+    accommodation = (context.get("travelPlan") or {}).get("companyProvidedAccommodationRequired")
+    summary = {}
+    for section in SUMMARY_SECTIONS:
+        if section == "companyProvidedAccommodation" and accommodation != "yes":
+            continue
+        summary[section] = context.get(section)
+    return f"```json\n{json.dumps(summary, indent=2, ensure_ascii=False)}\n```\n\n{CONFIRM_PROMPT}"
+
+
+class SummaryCache:
+    """LRU cache of rendered summaries keyed on the context fingerprint."""
+
+    def __init__(self, max_size=SUMMARY_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# Shared by every engine in the process so identical contexts reuse one summary
+shared_summary_cache = SummaryCache()
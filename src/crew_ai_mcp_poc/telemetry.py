@@ -0,0 +1,222 @@
+"""Lightweight span tracing and in-process metrics.
+
+Spans are exported as OTLP/JSON span objects, one per line, to the target
+named by TRACE_EXPORT: "stdout", "stderr", "file:<path>", or unset to
+disable export. Every span duration is also recorded in the metrics
+registry, which works whether or not export is enabled.
+
+A turn id (the trace id) is kept in a context variable and sent with every
+MCP tool call, so server-side spans join the client's trace.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "")
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "crew_ai_mcp_poc")
+
+# Histogram bucket upper bounds in milliseconds
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+_current_trace = contextvars.ContextVar("trace_id", default=None)
+_current_span = contextvars.ContextVar("span_id", default=None)
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of raw samples."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+class Histogram:
+    __slots__ = ("counts", "count", "total", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+
+    def observe(self, value_ms):
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if value_ms <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value_ms
+        self.min = min(self.min, value_ms)
+        self.max = max(self.max, value_ms)
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.counts):
+            seen += n
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "min_ms": self.min if self.count else 0.0,
+            "max_ms": self.max,
+            "p50_ms": self.quantile(0.5),
+            "p99_ms": self.quantile(0.99),
+        }
+
+
+class MetricsRegistry:
+    """Process-wide counters and latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value_ms):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(value_ms)
+
+    def dump(self):
+        with self._lock:
+            return {
+                "counters": dict(sorted(self._counters.items())),
+                "latency": {name: h.to_dict() for name, h in sorted(self._histograms.items())},
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+metrics = MetricsRegistry()
+
+
+class SpanExporter:
+    def __init__(self, target):
+        self._lock = threading.Lock()
+        self._file = None
+        self._stream = None
+        if target.startswith("file:"):
+            self._file = open(target[len("file:"):], "a", buffering=1, encoding="utf-8")
+        elif target == "stderr":
+            self._stream = sys.stderr
+        elif target == "stdout":
+            self._stream = sys.stdout
+
+    def export(self, span):
+        line = json.dumps(span, ensure_ascii=False)
+        with self._lock:
+            out = self._file or self._stream
+            if out is not None:
+                out.write(line + "\n")
+                out.flush()
+
+
+_exporter = SpanExporter(TRACE_EXPORT) if TRACE_EXPORT else None
+
+
+def protect_stdout():
+    """Send "stdout" exports to stderr, for processes whose stdout is a protocol stream."""
+    global _exporter
+    if TRACE_EXPORT == "stdout":
+        _exporter = SpanExporter("stderr")
+
+
+def new_turn_id():
+    return secrets.token_hex(16)
+
+
+def current_turn_id():
+    return _current_trace.get()
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+@contextmanager
+def span(name, turn_id=None, **attributes):
+    """Time a block as a span; ``turn_id`` starts or joins a trace."""
+    trace_id = turn_id or _current_trace.get() or new_turn_id()
+    span_id = secrets.token_hex(8)
+    parent_id = _current_span.get() if _current_trace.get() == trace_id else None
+    trace_token = _current_trace.set(trace_id)
+    span_token = _current_span.set(span_id)
+    start_ns = time.time_ns()
+    started = time.perf_counter()
+    status = {"code": 1}
+    try:
+        yield span_id
+    except Exception as e:
+        status = {"code": 2, "message": str(e)}
+        metrics.incr(f"{name}.errors")
+        raise
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+        metrics.observe(name, elapsed_ms)
+        if _exporter is not None:
+            _exporter.export({
+                "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+                "traceId": trace_id,
+                "spanId": span_id,
+                "parentSpanId": parent_id or "",
+                "name": name,
+                "startTimeUnixNano": str(start_ns),
+                "endTimeUnixNano": str(start_ns + int(elapsed_ms * 1_000_000)),
+                "attributes": [_attribute(k, v) for k, v in attributes.items()],
+                "status": status,
+            })
+
+
+def traced_tool(fn):
+    """Wrap an MCP tool handler in a span and accept an optional ``turn_id``.
+
+    The extra parameter is added to the visible signature so FastMCP puts it
+    in the tool schema; direct Python calls may omit it.
+    """
+    name = f"mcp.tool.{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, turn_id: str = "", **kwargs):
+        with span(name, turn_id=turn_id or None):
+            return fn(*args, **kwargs)
+
+    signature = inspect.signature(fn)
+    params = list(signature.parameters.values()) + [
+        inspect.Parameter("turn_id", inspect.Parameter.KEYWORD_ONLY, default="", annotation=str)
+    ]
+    wrapper.__signature__ = signature.replace(parameters=params)
+    return wrapper
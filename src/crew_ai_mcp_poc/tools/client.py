@@ -0,0 +1,309 @@
+"""Typed client over the MCP tools.
+
+Tools are indexed by name once, arguments are checked against each tool's
+``args_schema``, and results of the structured tools are decoded into the
+pydantic models below. The booking context models are generated from the
+server's BOOKING_SCHEMA.
+"""
+import asyncio
+import json
+import threading
+from typing import Optional
+
+from pydantic import BaseModel, ConfigDict, Field, create_model, model_validator
+from pydantic.alias_generators import to_camel, to_snake
+
+from crew_ai_mcp_poc.servers.schema import LAYOUT, SELECTED_FLIGHT
+from crew_ai_mcp_poc.telemetry import current_turn_id, metrics, span
+
+
+class ContextModel(BaseModel):
+    # Wire names are camelCase; attributes are snake_case
+    model_config = ConfigDict(alias_generator=to_camel, populate_by_name=True)
+
+
+class FlightSelection(ContextModel):
+    flight_id: str
+    airline: str
+    origin: str
+    destination: str
+    date: str
+    departure_time: str
+    price: str
+    cabin: str = Field(alias="class")
+
+
+class BookingContextBase(ContextModel):
+    def to_wire(self):
+        return self.model_dump(by_alias=True)
+
+
+def _section_model(section, names):
+    fields = {to_snake(name): (Optional[str], None) for name in names}
+    return create_model(section[0].upper() + section[1:], __base__=ContextModel, **fields)
+
+
+# One model per schema section, so a field added to BOOKING_SCHEMA is typed here too
+SECTION_MODELS = {section: _section_model(section, [name for name, _ in fields]) for section, fields in LAYOUT}
+
+BookingContext = create_model(
+    "BookingContext",
+    __base__=BookingContextBase,
+    **{to_snake(section): (model, Field(default_factory=model)) for section, model in SECTION_MODELS.items()},
+    **{to_snake(SELECTED_FLIGHT): (Optional[FlightSelection], None)},
+)
+
+
+class PendingFields(BaseModel):
+    fields: list[str] = []
+
+    @model_validator(mode="before")
+    @classmethod
+    def _from_result(cls, value):
+        # The MCP adapter returns only the first item of a list result, and
+        # nothing at all for an empty list
+        if value is None:
+            return {"fields": []}
+        if isinstance(value, str):
+            return {"fields": [value]}
+        if isinstance(value, list):
+            return {"fields": value}
+        return value
+
+    @property
+    def next(self):
+        return self.fields[0] if self.fields else None
+
+
+class FlightSearchPage(BaseModel):
+    results: list[FlightSelection] = []
+    total: int = 0
+    page: int = 1
+    page_size: int = 3
+
+
+class AdvanceResult(BaseModel):
+    updated: dict = {}
+    errors: dict[str, str] = {}
+    diff: dict = {}
+    pending: list[str] = []
+    next_field: Optional[str] = None
+    next_question: Optional[str] = None
+    version: int = 0
+
+
+class ContextDelta(BaseModel):
+    version: int = 0
+    since: int = 0
+    changed: dict = {}
+
+
+class ApprovalReceipt(BaseModel):
+    idempotency_key: str = Field(alias="idempotencyKey")
+    status: str
+    queued: bool
+    depth: int = 0
+
+
+# Result models of the structured tools; other tools return decoded JSON or text
+RESULT_MODELS = {
+    "get_context": BookingContext,
+    "get_pending_fields": PendingFields,
+    "search_flights": FlightSearchPage,
+    "apply_and_advance": AdvanceResult,
+    "get_context_delta": ContextDelta,
+    "confirm_booking": ApprovalReceipt,
+}
+
+
+def decode_result(result):
+    # Structured tool results arrive as JSON text over the MCP adapter
+    if isinstance(result, str):
+        try:
+            return json.loads(result)
+        except ValueError:
+            return result
+    return result
+
+
+class BoundTool:
+    """A tool resolved once, with optional fixed arguments.
+
+    Argument names are checked against the tool's schema when binding and on
+    each call; values are validated by the tool itself.
+    """
+
+    def __init__(self, tool, fixed=None, model=None):
+        self.tool = tool
+        self.name = tool.name
+        self.model = model
+        self.fixed = dict(fixed or {})
+
+        schema = getattr(tool, "args_schema", None)
+        fields = getattr(schema, "model_fields", None)
+        if fields is None:
+            self._known = None
+            self._required = frozenset()
+        else:
+            self._known = frozenset(fields)
+            self._required = frozenset(n for n, f in fields.items() if f.is_required())
+        # Servers that predate tracing do not take a turn id
+        self._sends_turn_id = self._known is None or "turn_id" in self._known
+        self._check(self.fixed, partial=True)
+
+    def _check(self, args, partial=False):
+        if self._known is not None:
+            unknown = args.keys() - self._known
+            if unknown:
+                raise ValueError(f"Tool '{self.name}' got unexpected arguments: {', '.join(sorted(unknown))}")
+        if not partial:
+            missing = self._required - args.keys()
+            if missing:
+                raise ValueError(f"Tool '{self.name}' is missing arguments: {', '.join(sorted(missing))}")
+
+    def raw(self, args=None):
+        args = {**self.fixed, **args} if args else dict(self.fixed)
+        self._check(args)
+        # The turn id lets the server's spans join this turn's trace
+        with span("mcp.call", tool=self.name):
+            if self._sends_turn_id:
+                args["turn_id"] = current_turn_id()
+            try:
+                return self.tool.run(args)
+            except IndexError:
+                return None
+
+    def __call__(self, **args):
+        result = decode_result(self.raw(args))
+        return self.model.model_validate(result) if self.model is not None else result
+
+    async def acall(self, **args):
+        return await asyncio.to_thread(self, **args)
+
+
+class ToolClient:
+    """Name-indexed view of an MCP tool list; iterates like the list it wraps.
+
+    With ``renew``, a callable returning the tools of a working connection,
+    a call that fails in transport (anything but a ValueError) renews the
+    tools once and is retried; the context server's tools are idempotent.
+    """
+
+    def __init__(self, tools, renew=None):
+        self._renew = renew
+        self._renew_lock = threading.Lock()
+        self.generation = 0
+        self._reset(tools)
+
+    def _reset(self, tools):
+        self._tools = list(tools)
+        self._index = {tool.name: tool for tool in self._tools}
+        self._bound = {}
+
+    @classmethod
+    def wrap(cls, tools):
+        return tools if isinstance(tools, cls) else cls(tools)
+
+    def __iter__(self):
+        return iter(self._tools)
+
+    def __len__(self):
+        return len(self._tools)
+
+    def __contains__(self, name):
+        return name in self._index
+
+    def get(self, name):
+        return self._index.get(name)
+
+    def bind(self, name, **fixed):
+        tool = self._index.get(name)
+        if tool is None:
+            raise ValueError(f"Tool '{name}' not found.")
+        return BoundTool(tool, fixed, RESULT_MODELS.get(name))
+
+    def tool(self, name):
+        """The cached, typed binding of ``name`` without fixed arguments."""
+        bound = self._bound.get(name)
+        if bound is None:
+            bound = self._bound[name] = self.bind(name)
+        return bound
+
+    def _run(self, name, call):
+        generation = self.generation
+        try:
+            return call(self.tool(name))
+        except ValueError:
+            raise
+        except Exception:
+            if self._renew is None:
+                raise
+        with self._renew_lock:
+            # Another thread may have renewed the tools since this call began
+            if self.generation == generation:
+                self._reset(self._renew())
+                self.generation += 1
+                metrics.incr("mcp.renewals")
+        return call(self.tool(name))
+
+    def call(self, name, args=None):
+        """Run a tool and return its raw (undecoded) result."""
+        return self._run(name, lambda tool: tool.raw(args))
+
+    async def acall(self, name, args=None):
+        return await asyncio.to_thread(self.call, name, args)
+
+    def get_context(self, session_id):
+        return self._run("get_context", lambda tool: tool(session_id=session_id))
+
+    def get_filled_context(self, session_id):
+        return self._run("get_filled_context", lambda tool: tool(session_id=session_id))
+
+    def get_context_delta(self, session_id, since_version=0):
+        return self._run("get_context_delta", lambda tool: tool(session_id=session_id, since_version=since_version))
+
+    def get_pending_fields(self, session_id):
+        return self._run("get_pending_fields", lambda tool: tool(session_id=session_id))
+
+    def search_flights(self, session_id, **options):
+        return self._run("search_flights", lambda tool: tool(session_id=session_id, **options))
+
+    def apply_and_advance(self, session_id, updates=None):
+        return self._run("apply_and_advance", lambda tool: tool(session_id=session_id, updates=updates or {}))
+
+    def confirm_booking(self, session_id):
+        return self._run("confirm_booking", lambda tool: tool(session_id=session_id))
+
+
+class ContextMirror:
+    """Client-side copy of a session's fields, kept current with deltas.
+
+    Each ``refresh`` ships only the fields changed since the last one.
+    """
+
+    def __init__(self, client, session_id):
+        self.client = client
+        self.session_id = session_id
+        self.version = 0
+        self.fields = {}
+
+    def refresh(self):
+        delta = self.client.get_context_delta(self.session_id, self.version)
+        if delta.since == 0:
+            self.fields = {}
+        self.fields.update(delta.changed)
+        self.version = delta.version
+        return self
+
+    def filled(self):
+        """The nested context with only the fields that hold a value."""
+        context = {}
+        for path, value in self.fields.items():
+            if not value:
+                continue
+            section, _, name = path.partition(".")
+            if name:
+                context.setdefault(section, {})[name] = value
+            else:
+                context[section] = value
+        return context
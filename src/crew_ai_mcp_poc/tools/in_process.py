@@ -0,0 +1,23 @@
+"""Context server tools called in this process, for offline runs without a transport."""
+
+
+class InProcessTool:
+    """Calls a context server tool function directly, without a transport."""
+
+    def __init__(self, name, fn):
+        self.name = name
+        self._fn = fn
+
+    def run(self, args):
+        return self._fn(**args)
+
+
+def in_process_tools():
+    from crew_ai_mcp_poc.servers import context_server
+    names = [
+        "ping", "get_field_options", "get_filled_fields", "get_pending_fields", "update_field",
+        "update_fields", "apply_and_advance", "get_next_question", "get_context", "get_filled_context",
+        "get_context_delta", "get_context_fingerprint", "get_session_stats", "get_metrics", "reset_state",
+        "search_flights", "set_selected_flight", "confirm_booking", "get_approval_queue_stats",
+    ]
+    return [InProcessTool(name, getattr(context_server, name)) for name in names]
@@ -1,14 +1,270 @@
-from crewai_tools import MCPServerAdapter
-from mcp import StdioServerParameters
+# crewai_tools and mcp are imported on first spawn, not at import time
+from crew_ai_mcp_poc.telemetry import span
+import atexit
 import os
+import threading
+import time
 
-def get_mcp_tools():
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "2"))
+HEALTH_CHECK_INTERVAL = float(os.getenv("MCP_HEALTH_CHECK_INTERVAL", "30"))
+
+
+def get_server_params():
+    from mcp import StdioServerParameters
     # Define MCP connection to context_server.py
-    server_params = StdioServerParameters(
+    return StdioServerParameters(
         command="python3",
         args=["src/crew_ai_mcp_poc/servers/context_server.py"],
         env={"UV_PYTHON": "3.12", **os.environ}
     )
 
-    return MCPServerAdapter(server_params)
 
+class PooledConnection:
+    """A warm MCP server connection owned by the pool.
+
+    Holders keep the connection for as long as they hold the lease; when
+    its server dies, ``renew`` respawns it in place, so every holder picks
+    up the new server through the same object.
+    """
+
+    def __init__(self, pool, adapter, spawn_seconds):
+        self.pool = pool
+        self.adapter = adapter
+        self.spawn_seconds = spawn_seconds
+        self.leases = 0
+        self.last_checked = time.monotonic()
+        self.closed = False
+        self._renew_lock = threading.Lock()
+
+    @property
+    def tools(self):
+        return self.adapter.tools
+
+    def client(self):
+        """A ToolClient over this connection that renews it when a call fails."""
+        from crew_ai_mcp_poc.tools.client import ToolClient
+        return ToolClient(self.tools, renew=self.renew)
+
+    def renew(self):
+        """The tools of a working server: this one if it still answers, else a respawned one."""
+        with self._renew_lock:
+            if self.closed:
+                raise RuntimeError("MCP connection is closed.")
+            if not self.ping():
+                old = self.adapter
+                self.adapter, self.spawn_seconds = self.pool._spawn_adapter()
+                self.last_checked = time.monotonic()
+                self.pool._record_restart()
+                try:
+                    old.stop()
+                except Exception:
+                    pass
+            return self.tools
+
+    def ping(self):
+        tool = next((t for t in self.adapter.tools if t.name == "ping"), None)
+        if tool is None:
+            return False
+        try:
+            return tool.run({}) == "pong"
+        except Exception:
+            return False
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.adapter.stop()
+        except Exception:
+            pass
+
+
+class MCPConnectionPool:
+    """Process-wide, bounded pool of long-lived context server connections.
+
+    Connections are spawned lazily up to ``max_size`` and shared between
+    sessions; a lease always goes to the least-loaded healthy connection.
+    A connection that fails its health check is respawned in place, so
+    sessions already holding it keep working.
+    Spawning and pinging happen outside the pool lock, so a slow server
+    start does not hold up leases of the connections already running.
+    """
+
+    def __init__(self, max_size=POOL_SIZE, health_check_interval=HEALTH_CHECK_INTERVAL):
+        self.max_size = max(1, max_size)
+        self.health_check_interval = health_check_interval
+        self._connections = []
+        self._spawning = 0
+        self._lock = threading.Lock()
+        # Signalled when a spawn finishes, for leases waiting on a full pool
+        self._changed = threading.Condition(self._lock)
+        self._closed = False
+        self.metrics = {
+            "leases": 0,
+            "pool_hits": 0,
+            "spawns": 0,
+            "restarts": 0,
+            "spawn_seconds": [],
+        }
+
+    def _spawn_adapter(self):
+        # Called without the pool lock held; only the metrics update takes it
+        from crewai_tools import MCPServerAdapter
+        started = time.perf_counter()
+        with span("mcp.spawn"):
+            adapter = MCPServerAdapter(get_server_params())
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self.metrics["spawns"] += 1
+            self.metrics["spawn_seconds"].append(elapsed)
+        return adapter, elapsed
+
+    def _record_restart(self):
+        with self._lock:
+            self.metrics["restarts"] += 1
+
+    def _check_due(self, conn):
+        # Claims the next health check for one caller; the ping runs unlocked
+        now = time.monotonic()
+        if now - conn.last_checked < self.health_check_interval:
+            return False
+        conn.last_checked = now
+        return True
+
+    def acquire(self):
+        with self._lock:
+            self.metrics["leases"] += 1
+            conn = self._choose()
+            check = conn is not None and self._check_due(conn)
+
+        if conn is None:
+            return self._spawn_leased()
+        if check:
+            try:
+                # Respawned in place if dead: other holders share this connection
+                conn.renew()
+            except Exception:
+                self.release(conn)
+                raise
+        with self._lock:
+            self.metrics["pool_hits"] += 1
+        return conn
+
+    def _choose(self):
+        """Lease an existing connection, or reserve a spawn and return None; call with the lock held."""
+        while True:
+            if self._closed:
+                raise RuntimeError("MCP connection pool is closed.")
+            idle = [c for c in self._connections if c.leases == 0]
+            if idle:
+                conn = idle[0]
+            elif len(self._connections) + self._spawning < self.max_size:
+                self._spawning += 1
+                return None
+            elif self._connections:
+                conn = min(self._connections, key=lambda c: c.leases)
+            else:
+                # Every slot is still spawning; share whichever starts first
+                self._changed.wait()
+                continue
+            conn.leases += 1
+            return conn
+
+    def _spawn_leased(self):
+        # Fills a slot reserved by _choose; the new connection starts leased once
+        conn = None
+        try:
+            conn = PooledConnection(self, *self._spawn_adapter())
+        finally:
+            with self._lock:
+                self._spawning -= 1
+                closed = self._closed
+                if conn is not None and not closed:
+                    conn.leases += 1
+                    self._connections.append(conn)
+                self._changed.notify_all()
+        if closed:
+            conn.close()
+            raise RuntimeError("MCP connection pool is closed.")
+        return conn
+
+    def release(self, conn):
+        with self._lock:
+            conn.leases = max(0, conn.leases - 1)
+
+    def lease(self):
+        return _Lease(self)
+
+    def warm_up(self, count=1):
+        while True:
+            with self._lock:
+                if self._closed or len(self._connections) + self._spawning >= min(count, self.max_size):
+                    return
+                self._spawning += 1
+            self.release(self._spawn_leased())
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            connections, self._connections = self._connections, []
+            self._changed.notify_all()
+        for conn in connections:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            spawn_seconds = self.metrics["spawn_seconds"]
+            leases = self.metrics["leases"]
+            return {
+                "connections": len(self._connections),
+                "active_leases": sum(c.leases for c in self._connections),
+                "leases": leases,
+                "pool_hits": self.metrics["pool_hits"],
+                "pool_hit_rate": self.metrics["pool_hits"] / leases if leases else 0.0,
+                "spawns": self.metrics["spawns"],
+                "restarts": self.metrics["restarts"],
+                "avg_spawn_seconds": sum(spawn_seconds) / len(spawn_seconds) if spawn_seconds else 0.0,
+                "max_spawn_seconds": max(spawn_seconds, default=0.0),
+            }
+
+
+class _Lease:
+    def __init__(self, pool):
+        self.pool = pool
+        self.conn = None
+
+    def __enter__(self):
+        self.conn = self.pool.acquire()
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.pool.release(self.conn)
+        return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = MCPConnectionPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def get_mcp_tools():
+    """Lease a warm connection from the process-wide pool.
+
+    The returned connection exposes ``.tools`` like ``MCPServerAdapter`` did,
+    and ``client()`` for a ToolClient that renews it after a failed call;
+    hand it back with ``release_mcp_tools`` when the session ends.
+    """
+    return get_pool().acquire()
+
+
+def release_mcp_tools(conn):
+    get_pool().release(conn)